@@ -0,0 +1,45 @@
+// Swaps the facades output by the youtube, vimeo and jsfiddle plugins for
+// their players, when clicked or, with data-trigger="visible", when they
+// scroll into view.
+(function () {
+  var observer = null;
+
+  function load(facade, autoplay) {
+    var iframe = document.createElement('iframe'),
+        src = facade.getAttribute('data-src');
+
+    if (observer) {
+      observer.unobserve(facade);
+    }
+    if (autoplay && facade.getAttribute('data-autoplay')) {
+      src += (src.indexOf('?') < 0 ? '?' : '&') + 'autoplay=1';
+    }
+    iframe.setAttribute('src', src);
+    iframe.setAttribute('width', facade.getAttribute('data-width'));
+    iframe.setAttribute('height', facade.getAttribute('data-height'));
+    iframe.setAttribute('frameborder', '0');
+    iframe.setAttribute('allow', 'autoplay; fullscreen');
+    iframe.setAttribute('allowfullscreen', 'allowfullscreen');
+    facade.parentNode.replaceChild(iframe, facade);
+  }
+
+  if ('IntersectionObserver' in window) {
+    observer = new IntersectionObserver(function (entries) {
+      entries.forEach(function (entry) {
+        if (entry.isIntersecting) {
+          load(entry.target, false);
+        }
+      });
+    }, { rootMargin: '200px' });
+  }
+
+  Array.prototype.forEach.call(document.querySelectorAll('.embed-facade'), function (facade) {
+    facade.addEventListener('click', function (event) {
+      event.preventDefault();
+      load(facade, true);
+    });
+    if (observer && facade.getAttribute('data-trigger') === 'visible') {
+      observer.observe(facade);
+    }
+  });
+})();
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers shared by the benchmark scripts, which are run from the root of the
+repository with the python environment the site is built with::
+
+    python bench/sitemap_bench.py
+"""
+from __future__ import print_function, unicode_literals
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGINS = os.path.join(ROOT, 'src', 'plugins')
+ARTICLES = os.path.join(ROOT, 'src', 'articles')
+CONFIG = os.path.join(ROOT, 'src', 'config.py')
+
+# Plugins that keep state between builds, which a benchmark shouldn't touch
+STATEFUL_PLUGINS = ['incremental', 'parallel_reader', 'rst_cache']
+
+# The plugins are imported as pelican imports them, from PLUGIN_PATHS
+if PLUGINS not in sys.path:
+    sys.path.insert(0, PLUGINS)
+
+
+def best_of(function, repeat=3):
+    """Returns the shortest of ``repeat`` timings of ``function()``, in
+    seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def report(name, old, new, count=None, unit='items'):
+    line = '{0}: {1:.3f}s -> {2:.3f}s ({3:.1f}x)'.format(name, old, new, old / new if new else float('inf'))
+    if count:
+        line += ', {0:.0f} -> {1:.0f} {2}/s'.format(count / old, count / new, unit)
+    print(line)
+
+
+def rst_sources():
+    """Returns the paths of the site's reStructuredText articles"""
+    paths = []
+    for root, dirs, files in os.walk(ARTICLES):
+        dirs.sort()
+        paths.extend(os.path.join(root, name) for name in sorted(files) if name.endswith('.rst'))
+    return paths
+
+
+def read_site(plugins=None):
+    """Builds the site into a scratch directory, with the plugins of the
+    config unless ``plugins`` is given, and returns its articles"""
+    from pelican import Pelican, signals
+    from pelican.settings import read_settings
+
+    output_path = tempfile.mkdtemp()
+    try:
+        settings = read_settings(CONFIG, override={
+            'OUTPUT_PATH': output_path,
+            'CACHE_PATH': os.path.join(output_path, 'cache'),
+            'CACHE_CONTENT': False,
+            'LOAD_CONTENT_CACHE': False,
+        })
+        if plugins is None:
+            plugins = [p for p in settings['PLUGINS'] if p not in STATEFUL_PLUGINS]
+        settings['PLUGINS'] = plugins
+
+        articles = []
+
+        def collect(generator):
+            articles.extend(generator.articles)
+
+        signals.article_generator_finalized.connect(collect)
+        try:
+            Pelican(settings).run()
+        finally:
+            signals.article_generator_finalized.disconnect(collect)
+        return articles
+    finally:
+        shutil.rmtree(output_path)
+
+
+MARKDOWN_PARAGRAPHS = [
+    'Plain text with *emphasis*, a [link](http://example.com) and `code`.',
+    'Inline math $a^2 + b^2 = c^2$ next to a price of 5 dollars and $x_{i}$.',
+    'Displayed math inside a paragraph $$\\sum_{i=1}^{n} i = \\frac{n(n+1)}{2}$$ and after it.',
+    '\\begin{align}\nf(x) &= x^2 \\\\\ng(x) &= \\sqrt{x}\n\\end{align}',
+    'Two displays $$e^{i\\pi} + 1 = 0$$ then $$\\int_0^1 x\\,dx$$ with $y$ between.',
+    'A paragraph without math, long enough to make the inline patterns walk '
+    'through some text before giving up on it, and with a stray $ sign.',
+]
+
+
+def markdown_document(paragraphs, offset=0):
+    """Returns a markdown document of ``paragraphs`` paragraphs cycling
+    through text with and without inline and displayed math"""
+    return '\n\n'.join(MARKDOWN_PARAGRAPHS[(offset + i) % len(MARKDOWN_PARAGRAPHS)]
+                       for i in range(paragraphs))
+
+
+def math_extension(**config):
+    """Returns render_math's markdown extension"""
+    from render_math.pelican_mathjax_markdown_extension import PelicanMathJaxExtension
+
+    settings = {
+        'mathjax_script': 'MathJax.Hub.Queue();',
+        'math_tag_class': 'math',
+        'auto_insert': True,
+    }
+    settings.update(config)
+    return PelicanMathJaxExtension(settings)
+
+
+def math_markdown(extension=None):
+    """Returns a Markdown instance with render_math's extension, which pelican
+    shares between the Markdown instances it creates"""
+    import markdown
+
+    return markdown.Markdown(extensions=[extension or math_extension()])
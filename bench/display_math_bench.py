@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Displayed math benchmark
+========================
+Converts markdown documents with thousands of displayed equations, with
+render_math's treeprocessor that moves displayed math out of its paragraph,
+and with the one it replaced, which looked up the index of every equation in
+its paragraph and of every paragraph in the document. Both must give the
+same html. The time spent in the treeprocessor is reported per equation,
+which stays flat as the documents grow when it scales linearly::
+
+    python bench/display_math_bench.py [--equations 1000 2000 4000 8000]
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import time
+
+import markdown
+
+from common import math_markdown
+
+from render_math.pelican_mathjax_markdown_extension import PelicanMathJaxCorrectDisplayMath
+
+
+class LegacyCorrectDisplayMath(PelicanMathJaxCorrectDisplayMath):
+
+    def legacy_correct_html(self, root, children, div_math, insert_idx, text):
+        current_idx = 0
+
+        for idx in div_math:
+            el = markdown.util.etree.Element('p')
+            el.text = text
+            el.extend(children[current_idx:idx])
+
+            if len(el) != 0 or (el.text and not el.text.isspace()):
+                root.insert(insert_idx, el)
+                insert_idx += 1
+
+            text = children[idx].tail
+            children[idx].tail = None
+            root.insert(insert_idx, children[idx])
+            insert_idx += 1
+            current_idx = idx+1
+
+        el = markdown.util.etree.Element('p')
+        el.text = text
+        el.extend(children[current_idx:])
+
+        if len(el) != 0 or (el.text and not el.text.isspace()):
+            root.insert(insert_idx, el)
+
+    def run(self, root):
+        math_tag_class = self.pelican_mathjax_extension.getConfig('math_tag_class')
+
+        for parent in root:
+            div_math = []
+            children = list(parent)
+
+            for div in parent.findall('div'):
+                if div.get('class') == math_tag_class:
+                    div_math.append(children.index(div))
+
+            if not div_math:
+                continue
+
+            insert_idx = list(root).index(parent)
+            self.legacy_correct_html(root, children, div_math, insert_idx, parent.text)
+            root.remove(parent)
+
+        return root
+
+
+def document(equations):
+    """Paragraphs of text and displayed math, with a few equations each, and
+    one long paragraph holding a tenth of the equations"""
+    paragraphs = []
+    long_paragraph = equations // 10
+    for i in range(0, equations - long_paragraph, 4):
+        paragraphs.append(' '.join('Step {0}, $$x_{{{0}}} = {0}$$ so'.format(j)
+                                   for j in range(i, min(i + 4, equations - long_paragraph))))
+    paragraphs.append(' and '.join('$$y_{{{0}}}$$'.format(j) for j in range(long_paragraph)))
+    return '\n\n'.join(paragraphs)
+
+
+def convert(source, processor_class):
+    """Returns the html of source, and the time spent correcting its
+    displayed math"""
+    md = math_markdown()
+    processor = md.treeprocessors['mathjax_correctdisplayedmath']
+    if processor_class is not None:
+        processor = md.treeprocessors['mathjax_correctdisplayedmath'] = processor_class(
+            processor.pelican_mathjax_extension)
+
+    spent = []
+    run = processor.run
+
+    def timed_run(root):
+        start = time.time()
+        try:
+            return run(root)
+        finally:
+            spent.append(time.time() - start)
+
+    processor.run = timed_run
+    return md.convert(source), sum(spent)
+
+
+def best_convert(source, processor_class, repeat=3):
+    """Returns the html of source, and the shortest of ``repeat`` times spent
+    correcting its displayed math"""
+    runs = [convert(source, processor_class) for _ in range(repeat)]
+    return runs[0][0], min(spent for _, spent in runs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--equations', type=int, nargs='+', default=[1000, 2000, 4000, 8000])
+    args = parser.parse_args()
+
+    for equations in args.equations:
+        source = document(equations)
+        old_html, old = best_convert(source, LegacyCorrectDisplayMath)
+        new_html, new = best_convert(source, None)
+        if old_html != new_html:
+            raise SystemExit('the html differs for {0} equations'.format(equations))
+        print('{0} equations, identical output: {1:.3f}s -> {2:.3f}s, '
+              '{3:.1f} -> {4:.1f} us/equation'.format(
+                  equations, old, new, old / equations * 1e6, new / equations * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Markdown math benchmark
+=======================
+Converts markdown documents with inlined and displayed math, with
+render_math's extension, which finds both with one tokenizer, and with the
+extension it replaced, which registered a pattern for each that markdown ran
+over every text node, rescanning the node from its start after each match.
+Both must give the same html. Documents of ordinary prose and documents
+whose paragraphs are dense with math are timed separately::
+
+    python bench/markdown_math_bench.py [--documents 500] [--paragraphs 40] [--spans 200]
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+
+import markdown
+
+from common import best_of, markdown_document, math_extension, math_markdown, report
+
+from render_math.pelican_mathjax_markdown_extension import (
+    PelicanMathJaxAddJavaScript, PelicanMathJaxCorrectDisplayMath, PelicanMathJaxExtension)
+
+
+class LegacyMathJaxPattern(markdown.inlinepatterns.Pattern):
+
+    def __init__(self, pelican_mathjax_extension, md, tag, pattern):
+        super(LegacyMathJaxPattern, self).__init__(pattern, md)
+        self.math_tag_class = pelican_mathjax_extension.getConfig('math_tag_class')
+        self.markdown_instance = md
+        self.tag = tag
+
+    def handleMatch(self, m):
+        node = markdown.util.etree.Element(self.tag)
+        node.set('class', self.math_tag_class)
+
+        prefix = '\\(' if m.group('prefix') == '$' else m.group('prefix')
+        suffix = '\\)' if m.group('suffix') == '$' else m.group('suffix')
+        node.text = markdown.util.AtomicString(prefix + m.group('math') + suffix)
+
+        self.markdown_instance.mathjax_needed = True
+        return node
+
+
+class LegacyMathJaxExtension(PelicanMathJaxExtension):
+
+    def extendMarkdown(self, md, md_globals):
+        md.mathjax_needed = False
+
+        mathjax_inline_regex = r'(?P<prefix>\$)(?P<math>.+?)(?P<suffix>(?<!\s)\2)'
+        mathjax_display_regex = r'(?P<prefix>\$\$|\\begin\{(.+?)\})(?P<math>.+?)(?P<suffix>\2|\\end\{\3\})'
+
+        md.inlinePatterns.add('mathjax_displayed', LegacyMathJaxPattern(self, md, 'div', mathjax_display_regex), '<escape')
+        md.inlinePatterns.add('mathjax_inlined', LegacyMathJaxPattern(self, md, 'span', mathjax_inline_regex), '<escape')
+        md.treeprocessors.add('mathjax_correctdisplayedmath', PelicanMathJaxCorrectDisplayMath(self), '>inline')
+        if self.getConfig('auto_insert'):
+            md.treeprocessors.add('mathjax_addjavascript', PelicanMathJaxAddJavaScript(self, md), '_end')
+
+
+def dense_document(paragraphs, spans):
+    """Returns a markdown document whose paragraphs each hold ``spans``
+    inlined and as many displayed equations"""
+    return '\n\n'.join(
+        ' '.join('term $a_{{{0}}}$ plus $$b_{{{0}}}$$ and'.format(i) for i in range(spans))
+        for _ in range(paragraphs))
+
+
+def compare(name, documents, old_md, new_md):
+    for document in documents:
+        if old_md.convert(document) != new_md.convert(document):
+            raise SystemExit('the html differs for:\n' + document)
+
+    old = best_of(lambda: [old_md.convert(document) for document in documents])
+    new = best_of(lambda: [new_md.convert(document) for document in documents])
+    report(name + ', identical output', old, new, len(documents), 'documents')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--documents', type=int, default=500)
+    parser.add_argument('--paragraphs', type=int, default=40)
+    parser.add_argument('--spans', type=int, default=200)
+    args = parser.parse_args()
+
+    legacy_config = dict((key, value[0]) for key, value in math_extension().config.items())
+    old_md = markdown.Markdown(extensions=[LegacyMathJaxExtension(legacy_config)])
+    new_md = math_markdown()
+
+    compare('{0} documents of {1} paragraphs'.format(args.documents, args.paragraphs),
+            [markdown_document(args.paragraphs, i) for i in range(args.documents)], old_md, new_md)
+    compare('{0} documents of 4 paragraphs with {1} equations each'.format(args.documents // 10, 2 * args.spans),
+            [dense_document(4, args.spans)] * (args.documents // 10), old_md, new_md)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent markdown stress test
+===============================
+Converts many markdown documents at once on a pool of threads, one Markdown
+instance per thread and one render_math extension shared by all of them, as
+pelican shares it, and checks every document comes out as it does when
+converted on its own. In particular the mathjax script must be attached to
+the documents with math, and only to them::
+
+    python bench/markdown_threads_bench.py [--documents 2000] [--threads 8] [--rounds 5]
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import sys
+import threading
+import time
+
+from multiprocessing.pool import ThreadPool
+
+from common import markdown_document, math_extension, math_markdown
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--documents', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    # Every third document is a single paragraph without math
+    documents = [markdown_document(1 if i % 3 == 0 else 1 + i % 12, 0 if i % 3 == 0 else i)
+                 for i in range(args.documents)]
+    expected = [math_markdown().convert(document) for document in documents]
+    with_math = sum(1 for html in expected if '<script' in html)
+    if with_math != args.documents - len(documents[::3]):
+        raise SystemExit('the script is attached to {0} documents'.format(with_math))
+
+    # Switch threads as often as possible, to interleave the conversions
+    if hasattr(sys, 'setswitchinterval'):
+        sys.setswitchinterval(1e-6)
+
+    extension = math_extension()
+    local = threading.local()
+
+    def convert(document):
+        if not hasattr(local, 'md'):
+            local.md = math_markdown(extension)
+        return local.md.convert(document)
+
+    pool = ThreadPool(args.threads)
+    try:
+        start = time.time()
+        for round in range(args.rounds):
+            converted = pool.map(convert, documents, 1)
+            wrong = [i for i, (html, ok) in enumerate(zip(converted, expected)) if html != ok]
+            if wrong:
+                raise SystemExit('round {0}: {1} documents differ, the first is #{2}'.format(
+                    round, len(wrong), wrong[0]))
+        elapsed = time.time() - start
+    finally:
+        pool.close()
+        pool.join()
+
+    print('{0} rounds of {1} documents, {2} with math, on {3} threads: identical output, {4:.0f} documents/s'.format(
+        args.rounds, args.documents, with_math, args.threads, args.rounds * args.documents / elapsed))
+
+
+if __name__ == '__main__':
+    main()
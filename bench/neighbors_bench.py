@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Neighbors benchmark
+===================
+Links the neighbors of a synthetic multilingual site, with the neighbors
+plugin and with the version that walked the translations of a neighbor for
+every translation of every article, in every ordering. Every next_* and
+prev_* attribute of every article and translation is then read, as the
+templates would, and both must give the same neighbors::
+
+    python bench/neighbors_bench.py [--articles 10000] [--languages 10]
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import time
+
+from datetime import datetime, timedelta
+from operator import attrgetter
+
+from common import report
+
+from neighbors.neighbors import is_date_ordered, neighbors
+
+LANGUAGES = ['en', 'fr', 'de', 'es', 'it', 'nl', 'pt', 'pl', 'sv', 'fi', 'da', 'cs']
+NAMES = ['article', 'article_in_category',
+         'article_in_subcategory0', 'article_in_subcategory1', 'article_in_subcategory2']
+
+
+def legacy_get_translation(article, prefered_language):
+    if not article:
+        return None
+    for translation in article.translations:
+        if translation.lang == prefered_language:
+            return translation
+    return article
+
+
+def legacy_link(newer, older, next_name, prev_name):
+    if newer:
+        setattr(newer, prev_name, older)
+        for translation in newer.translations:
+            setattr(translation, prev_name, legacy_get_translation(older, translation.lang))
+    if older:
+        setattr(older, next_name, newer)
+        for translation in older.translations:
+            setattr(translation, next_name, legacy_get_translation(newer, translation.lang))
+
+
+def legacy_set_neighbors(articles, next_name, prev_name):
+    newer = None
+    for article in articles:
+        legacy_link(newer, article, next_name, prev_name)
+        newer = article
+    legacy_link(newer, None, next_name, prev_name)
+
+
+def legacy_neighbors(generator):
+    legacy_set_neighbors(generator.articles, 'next_article', 'prev_article')
+
+    articles = generator.articles
+    if not is_date_ordered(articles):
+        articles = sorted(articles, key=attrgetter('date'), reverse=True)
+
+    subcategories = {}
+    for subcategory, members in getattr(generator, 'subcategories', ()):
+        index = subcategory.name.count('/')
+        group = ('next_article_in_subcategory{}'.format(index),
+                 'prev_article_in_subcategory{}'.format(index),
+                 subcategory.name)
+        for article in members:
+            subcategories.setdefault(id(article), []).append(group)
+
+    newest = {}
+    for article in articles:
+        groups = [('next_article_in_category', 'prev_article_in_category',
+                   article.category)]
+        groups.extend(subcategories.get(id(article), ()))
+        for group in groups:
+            legacy_link(newest.get(group), article, group[0], group[1])
+            newest[group] = article
+
+    for group, article in newest.items():
+        legacy_link(article, None, group[0], group[1])
+
+
+class Article(object):
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class Translation(Article):
+    pass
+
+
+class Category(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+class Generator(object):
+
+    def __init__(self, articles, subcategories):
+        self.articles = articles
+        self.subcategories = subcategories
+
+
+def build_site(articles, languages):
+    """Returns a generator of ``articles`` articles, newest first, each
+    translated into ``languages - 1`` other languages, in 20 categories with
+    two levels of subcategories"""
+    categories = [Category('category-{0}'.format(i)) for i in range(20)]
+    subcategories = {}
+    start = datetime(2018, 1, 1)
+    site = []
+    for i in range(articles):
+        category = categories[i % len(categories)]
+        path = [category.name, 'sub-{0}'.format(i % 3), 'subsub-{0}'.format(i % 2)]
+        article = Article(title='article-{0}'.format(i), lang=LANGUAGES[0], category=category,
+                          date=start - timedelta(hours=i))
+        article.translations = [
+            Translation(title='article-{0}-{1}'.format(i, lang), lang=lang, category=category,
+                        date=article.date, translations=[article])
+            for lang in LANGUAGES[1:languages]]
+        site.append(article)
+        for depth in range(len(path)):
+            name = '/'.join(path[:depth + 1])
+            subcategories.setdefault(name, (Category(name), []))[1].append(article)
+    return Generator(site, sorted(subcategories.values(), key=lambda s: s[0].name))
+
+
+def read_neighbors(articles):
+    """Reads every neighbor attribute of every article and translation, and
+    returns their titles"""
+    titles = []
+    for article in articles:
+        for content in [article] + article.translations:
+            for name in NAMES:
+                for prefix in ('next_', 'prev_'):
+                    neighbor = getattr(content, prefix + name, False)
+                    titles.append(getattr(neighbor, 'title', neighbor))
+    return titles
+
+
+def run(function, articles, languages):
+    generator = build_site(articles, languages)
+    start = time.time()
+    function(generator)
+    linked = time.time()
+    titles = read_neighbors(generator.articles)
+    end = time.time()
+    return titles, end - start, linked - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--articles', type=int, default=10000)
+    parser.add_argument('--languages', type=int, default=10)
+    args = parser.parse_args()
+
+    old_titles, old, old_linked = run(legacy_neighbors, args.articles, args.languages)
+    new_titles, new, new_linked = run(neighbors, args.articles, args.languages)
+    if old_titles != new_titles:
+        raise SystemExit('the neighbors differ')
+
+    report('{0} articles in {1} languages, identical neighbors'.format(args.articles, args.languages),
+           old, new, args.articles * args.languages, 'articles and translations')
+    print('linking alone: {0:.3f}s -> {1:.3f}s'.format(old_linked, new_linked))
+
+
+if __name__ == '__main__':
+    main()
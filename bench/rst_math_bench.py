@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+reStructuredText math benchmark
+===============================
+Reads thousands of synthetic reStructuredText pages, a third of them with
+math, with render_math's reader, whose translator notes math as docutils
+renders it and appends the script to the body before it is joined, and with
+pelican's reader followed by the rst_add_mathjax step it replaced, which
+checked the extension of every source, searched every body for math and
+appended the script to it. Both must give the same html. The time of the
+step after reading is reported on its own, as reading dominates::
+
+    python bench/rst_math_bench.py [--pages 2000] [--paragraphs 20]
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import copy
+import os
+import shutil
+import tempfile
+import time
+
+from codecs import open
+
+from common import report
+
+from pelican.readers import RstReader
+from pelican.settings import DEFAULT_CONFIG
+
+from render_math.pelican_mathjax_rst_reader import PelicanMathJaxHTMLTranslator, PelicanMathJaxRstReader
+
+MATHJAX_TAG = '<script type="text/javascript" src="/theme/js/mathjax.js"></script>'
+
+PARAGRAPH = 'Some text about trees, with *emphasis*, ``literals`` and a `link <http://example.com>`_.'
+MATH_PARAGRAPHS = [
+    'Euclid proved that :math:`p \\mid ab` implies :math:`p \\mid a` or :math:`p \\mid b`.',
+    '.. math::\n\n   \\sum_{i=1}^{n} i = \\frac{n(n+1)}{2}',
+]
+
+
+def legacy_rst_add_mathjax(source_path, content):
+    _, ext = os.path.splitext(os.path.basename(source_path))
+    if ext != '.rst':
+        return content
+    if 'class="math"' in content:
+        content += MATHJAX_TAG
+    return content
+
+
+def write_pages(path, pages, paragraphs):
+    """Writes the synthetic pages and returns their paths"""
+    paths = []
+    for i in range(pages):
+        body = []
+        for j in range(paragraphs):
+            if i % 3 == 0 and j % 10 == 5:
+                body.append(MATH_PARAGRAPHS[j % 2])
+            else:
+                body.append(PARAGRAPH)
+        source_path = os.path.join(path, 'page-{0}.rst'.format(i))
+        with open(source_path, 'w', encoding='utf-8') as fd:
+            fd.write('Page {0}\n{1}\n\n:date: 2018-01-01\n\n{2}\n'.format(
+                i, '#' * len('Page {0}'.format(i)), '\n\n'.join(body)))
+        paths.append(source_path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=2000)
+    parser.add_argument('--paragraphs', type=int, default=20)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp()
+    try:
+        paths = write_pages(path, args.pages, args.paragraphs)
+        settings = copy.deepcopy(DEFAULT_CONFIG)
+        settings['PATH'] = path
+        settings['DOCUTILS_SETTINGS'] = {'math_output': 'MathJax /theme/js/MathJax.js'}
+        PelicanMathJaxHTMLTranslator.mathjax_tag = MATHJAX_TAG
+
+        old_reader = RstReader(settings)
+        start = time.time()
+        old_read = [old_reader.read(source_path)[0] for source_path in paths]
+        old_step = time.time()
+        old_html = [legacy_rst_add_mathjax(source_path, content) for source_path, content in zip(paths, old_read)]
+        end = time.time()
+        old, old_step = end - start, end - old_step
+
+        new_reader = PelicanMathJaxRstReader(settings)
+        start = time.time()
+        new_html = [new_reader.read(source_path)[0] for source_path in paths]
+        new = time.time() - start
+
+        if old_html != new_html:
+            raise SystemExit('the html differs')
+        with_math = sum(1 for html in new_html if html.endswith(MATHJAX_TAG))
+
+        name = '{0} pages of {1} paragraphs, {2} with math, identical output'.format(
+            args.pages, args.paragraphs, with_math)
+        report(name, old, new, args.pages, 'pages')
+        print('step after reading: {0:.1f}ms -> 0ms, {1:.1f}us per page'.format(
+            old_step * 1000, old_step / args.pages * 1e6))
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Sitemap benchmark
+=================
+Builds the sitemap of a synthetic site, with the plugin's generator and with
+the generator it replaced, which checked that every url's output exists with
+its own stat, matched it against each exclude rule in turn, and formatted and
+wrote its entry on its own. Both must write the same bytes::
+
+    python bench/sitemap_bench.py [--pages 100000] [--rules 40]
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import re
+import shutil
+import tempfile
+
+from codecs import open
+from datetime import datetime, timedelta
+
+from common import best_of, report
+
+from pelican import contents
+
+from sitemap import sitemap
+from sitemap.sitemap import SitemapGenerator, XML_HEADER, XML_FOOTER, XML_URL, TXT_HEADER
+
+
+class BenchArticle(contents.Article):
+    """An article with its attributes given rather than read from a source"""
+    url = save_as = None
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class BenchWrapper(object):
+    """A category, tag or author"""
+
+    def __init__(self, url):
+        self.url = url
+        self.save_as = url + 'index.html'
+
+
+class LegacySitemapGenerator(SitemapGenerator):
+    """Writes the sitemap as the plugin did before it was optimized"""
+
+    def legacy_write_url(self, page, fd):
+        if getattr(page, 'status', 'published') != 'published':
+            return
+        if not page.save_as:
+            return
+
+        page_path = os.path.join(self.output_path, page.save_as)
+        if not os.path.exists(page_path):
+            return
+
+        lastdate = getattr(page, 'date', None) or self.now
+        lastdate = self.get_date_modified(page, lastdate)
+        lastmod = sitemap.format_date(lastdate)
+
+        if isinstance(page, contents.Article):
+            pri = self.priorities['articles']
+            chfreq = self.changefreqs['articles']
+        elif isinstance(page, contents.Page):
+            pri = self.priorities['pages']
+            chfreq = self.changefreqs['pages']
+        else:
+            pri = self.priorities['indexes']
+            chfreq = self.changefreqs['indexes']
+
+        pageurl = '' if page.url == 'index.html' else page.url
+
+        if self.format == 'xml':
+            for regstr in self.sitemapExclude:
+                if re.match(regstr, pageurl):
+                    return
+            fd.write(XML_URL.format(self.siteurl, pageurl, lastmod, chfreq, pri))
+        else:
+            fd.write(self.siteurl + '/' + pageurl + '\n')
+
+    def generate_output(self, writer):
+        self.set_url_wrappers_modification_date(self.context['categories'])
+        self.set_url_wrappers_modification_date(self.context['tags'])
+        self.set_url_wrappers_modification_date(self.context['authors'])
+
+        path = os.path.join(self.output_path, 'sitemap.{0}'.format(self.format))
+        with open(path, 'w', encoding='utf-8') as fd:
+            if self.format == 'xml':
+                fd.write(XML_HEADER)
+            else:
+                fd.write(TXT_HEADER.format(self.siteurl))
+            for page in self.iter_pages():
+                self.legacy_write_url(page, fd)
+            if self.format == 'xml':
+                fd.write(XML_FOOTER)
+
+
+def build_site(output_path, pages):
+    """Writes the outputs of a synthetic site, and returns its context"""
+    start = datetime(2010, 1, 1)
+    categories = [BenchWrapper('blog/category-{0}/'.format(i)) for i in range(50)]
+    tags = [BenchWrapper('blog/tag/tag-{0}/'.format(i)) for i in range(500)]
+    authors = [BenchWrapper('blog/author/author-{0}/'.format(i)) for i in range(20)]
+
+    articles = []
+    members = dict((id(wrapper), []) for wrapper in categories + tags + authors)
+    for i in range(pages):
+        url = 'blog/category-{0}/article-{1}/'.format(i % len(categories), i)
+        article = BenchArticle(
+            status='published' if i % 50 else 'draft',
+            # Articles published in the same hour share their lastmod
+            date=start + timedelta(hours=i // 3),
+            url=url, save_as=url + 'index.html', translations=[])
+        if i % 7 == 0:
+            article.modified = article.date + timedelta(days=1)
+        articles.append(article)
+        members[id(categories[i % len(categories)])].append(article)
+        members[id(tags[i % len(tags)])].append(article)
+        members[id(authors[i % len(authors)])].append(article)
+
+    # One article in ten has no output, as when pelican skipped writing it
+    for i, content in enumerate(articles + categories + tags + authors):
+        if i < pages and i % 10 == 0:
+            continue
+        path = os.path.join(output_path, content.save_as)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, 'w').close()
+
+    return {
+        'pages': [],
+        'articles': articles,
+        'categories': [(c, members[id(c)]) for c in categories],
+        'tags': [(t, members[id(t)]) for t in tags],
+        'authors': [(a, members[id(a)]) for a in authors],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=100000)
+    parser.add_argument('--rules', type=int, default=40)
+    args = parser.parse_args()
+
+    output_path = tempfile.mkdtemp()
+    try:
+        context = build_site(output_path, args.pages)
+        settings = {
+            'SITEURL': 'https://example.com',
+            'TIMEZONE': 'UTC',
+            'SITEMAP': {
+                'format': 'xml',
+                'exclude': ['blog/tag/tag-{0}/'.format(i) for i in range(args.rules - 1)] + ['blog/author/'],
+            },
+        }
+        now = datetime(2020, 1, 1)
+
+        def run(cls):
+            generator = cls(context, settings, None, None, output_path)
+            generator.now = now
+            generator.generate_output(None)
+            with open(os.path.join(output_path, 'sitemap.xml'), 'rb') as fd:
+                return fd.read()
+
+        if run(LegacySitemapGenerator) != run(SitemapGenerator):
+            raise SystemExit('the sitemaps differ')
+
+        old = best_of(lambda: run(LegacySitemapGenerator))
+        new = best_of(lambda: run(SitemapGenerator))
+        count = args.pages + 570
+        report('sitemap of {0} urls, {1} exclude rules, identical output'.format(count, args.rules),
+               old, new, count, 'urls')
+    finally:
+        shutil.rmtree(output_path)
+
+
+if __name__ == '__main__':
+    main()
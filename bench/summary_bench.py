@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Summary math benchmark
+======================
+Fixes the math cut off in the summaries of the site's articles, scaled up to
+``--documents`` summaries truncated at various lengths, with render_math's
+fix_summary and with the one it replaced, which parsed every summary with
+BeautifulSoup. Both must give the same summaries::
+
+    python bench/summary_bench.py [--documents 10000]
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import itertools
+
+from common import best_of, read_site, report
+
+from bs4 import BeautifulSoup
+from pelican.utils import truncate_html_words
+
+from render_math import math
+
+
+def legacy_fix_summary(summary_and_content):
+    summary, content = summary_and_content
+    summary_parsed = BeautifulSoup(summary, 'html.parser')
+    math = summary_parsed.find_all(class_='math')
+
+    if len(math) == 0:
+        return None
+
+    last_math_text = math[-1].get_text()
+    if len(last_math_text) > 3 and last_math_text[-3:] == '...':
+        content_parsed = BeautifulSoup(content, 'html.parser')
+        full_text = content_parsed.find_all(class_='math')[len(math)-1].get_text()
+        math[-1].string = "%s ..." % full_text
+        summary = summary_parsed.decode()
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--documents', type=int, default=10000)
+    args = parser.parse_args()
+
+    # Cut at several lengths, so that some summaries end inside math
+    pairs = []
+    for article in read_site():
+        for words in (10, 25, 50, 100, 200):
+            pairs.append((truncate_html_words(article._content, words), article._content))
+    documents = list(itertools.islice(itertools.cycle(pairs), args.documents))
+
+    if [legacy_fix_summary(d) for d in documents] != [math.fix_summary(d) for d in documents]:
+        raise SystemExit('the summaries differ')
+
+    with_math = sum(1 for summary, _ in documents if 'class="math"' in summary)
+    old = best_of(lambda: [legacy_fix_summary(d) for d in documents])
+    new = best_of(lambda: [math.fix_summary(d) for d in documents])
+    report('{0} summaries, {1} with math, identical output'.format(len(documents), with_math),
+           old, new, len(documents), 'summaries')
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,7 @@ import gulp           from 'gulp';
 import log            from 'fancy-log';
 import rimraf         from 'rimraf';
 import child_process  from 'child_process';
+import net            from 'net';
 
 // Load all Gulp plugins into one variable
 const $ = plugins();
@@ -59,13 +60,31 @@ const PATHS = {
 
 
 
+// Production builds run pelican itself, so that they can't be answered by a
+// development builder that is still running
 const PELICAN_BUILD_CMD = [
   'pelican',
   PATHS.pelican.src,
   '-o',
   PATHS.pelican.dest,
   '-s',
+  `${PATHS.pelican.src}/config.py`
+];
+
+// In development, the builder keeps pelican, the settings and the plugins
+// loaded, and builds the site whenever it's asked to on this port
+const PELICAN_BUILDER_PORT = 8010;
+
+const PELICAN_BUILDER_CMD = [
+  'python',
+  `${PATHS.pelican.src}/builder.py`,
+  PATHS.pelican.src,
+  '-o',
+  PATHS.pelican.dest,
+  '-s',
   `${PATHS.pelican.src}/config.py`,
+  '--port',
+  String(PELICAN_BUILDER_PORT),
   '-D'
 ];
 
@@ -80,8 +99,12 @@ const UNCSS_OPTIONS = {
 const PRODUCTION = !!(yargs.argv.production);
 
 // Delete the "build" folder
-// This happens every time a build starts
+// This happens every time a production build starts. Development builds
+// keep it, so that the incremental plugin only writes what has changed
 function clean(done) {
+  if (!PRODUCTION) {
+    return done();
+  }
   rimraf(PATHS.pelican.dest, done);
 }
 
@@ -142,29 +165,107 @@ function uncss() {
     .pipe(gulp.dest(PATHS.pelican.dest + '/assets/css/'));
 }
     
-var building = false;
 // Clone the environment and set DEBUG when developing
 var env = Object.create(process.env);
 if (PRODUCTION) {
   env.DEBUG = '0';
 }
 
-function pelican() {
-  if (building) {
-    log.warn("...pelican build in progress.");
+var builder = null;
+
+// Start the builder, unless it's running already
+function startBuilder() {
+  if (builder) {
     return;
   }
-  building = true;
-  var proc = child_process.spawn(PELICAN_BUILD_CMD[0], PELICAN_BUILD_CMD.slice(1), {env: env, stdio: 'inherit'});
-  proc.on('error', (error) => {
-    building = false;
+  builder = child_process.spawn(PELICAN_BUILDER_CMD[0], PELICAN_BUILDER_CMD.slice(1), {env: env, stdio: 'inherit'});
+  builder.on('error', (error) => {
     log.error(error);
   });
-  proc.on('close', () => {
-    building = false;
-    log.info("done pelican");
+  builder.on('exit', () => {
+    builder = null;
+  });
+  // Let gulp exit when its tasks are done, and take the builder with it
+  builder.unref();
+}
+
+process.on('exit', () => {
+  if (builder) {
+    builder.kill();
+  }
+});
+
+// Build the site with pelican, and fail on errors
+function pelicanBuild() {
+  return new Promise((resolve, reject) => {
+    var proc = child_process.spawn(PELICAN_BUILD_CMD[0], PELICAN_BUILD_CMD.slice(1), {env: env, stdio: 'inherit'});
+    proc.on('error', reject);
+    proc.on('close', (code) => {
+      if (code) {
+        reject(new Error(`pelican exited with ${code}`));
+      } else {
+        log.info("done pelican");
+        resolve();
+      }
+    });
+  });
+}
+
+// Ask the builder for a build. Changes made during a build are built
+// together by the next one, rather than dropped
+function pelican() {
+  if (PRODUCTION) {
+    return pelicanBuild();
+  }
+  startBuilder();
+  return new Promise((resolve, reject) => {
+    var attempts = 0;
+    var request = () => {
+      var answer = '';
+      var answered = false;
+      // The builder may still be starting, or restarting to load changed
+      // settings or plugins
+      var retry = () => {
+        if (answered) {
+          return;
+        }
+        answered = true;
+        if (++attempts > 100) {
+          reject(new Error("pelican builder isn't answering"));
+          return;
+        }
+        startBuilder();
+        setTimeout(request, 200);
+      };
+      var socket = net.connect(PELICAN_BUILDER_PORT, '127.0.0.1', () => {
+        // The builder refuses to build with other settings than these
+        socket.write(`build ${PWD}/${PATHS.pelican.src}/config.py\n`);
+      });
+      socket.on('data', (data) => {
+        answer += data;
+        if (answered || answer.indexOf('\n') < 0) {
+          return;
+        }
+        answer = answer.trim();
+        if (answer == 'restart') {
+          retry();
+        } else {
+          answered = true;
+          if (answer.startsWith('ok ')) {
+            log.info(`done pelican in ${answer.slice(3)}s`);
+            resolve();
+          } else {
+            log.error(answer);
+            resolve();
+          }
+        }
+        socket.end();
+      });
+      socket.on('error', retry);
+      socket.on('close', retry);
+    };
+    request();
   });
-  return proc;
 }
 
 // Start a server with BrowserSync to preview the site in
@@ -184,8 +285,12 @@ function reload(done) {
 // Watch for changes to static sass files
 function watch() {
   gulp.watch(PATHS.sass.src + '/**/*.scss').on('all', sass);
+  // Not what the builder writes itself, which would have it build again
   gulp.watch([
     `${PATHS.pelican.src}/**/*`,
+    `!${PATHS.pelican.src}/cache/**`,
+    `!${PATHS.pelican.src}/**/__pycache__/**`,
+    `!${PATHS.pelican.src}/**/*.py[co]`,
   ]).on('all', gulp.series(pelican, uncss, reload));
 }
 
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*- #
+"""
+Keeps pelican, the settings and the plugins loaded between builds, and builds
+the site whenever it's asked to over a local socket::
+
+    python src/builder.py src -o build -s src/config.py --port 8010
+
+A request is a line, ``build``, optionally followed by the path of the
+settings the site should be built with. Builders started with other settings
+refuse it, rather than build a different site. It is answered with a line
+once a build that started after the request has finished:
+
+- ``ok <seconds>``, the site was built
+
+- ``error <message>``, the build failed
+
+- ``restart``, the settings or a plugin changed, and the builder is starting
+  again to load them. Send the request again once it's listening
+
+Requests that arrive during a build, or within ``--delay`` seconds of each
+other, are answered together by the next build.
+
+Plugins are initialized once, so what they keep between builds, like the
+gists already checked by the gist plugin, lasts as long as the builder. The
+parallel_reader plugin's pool of processes is turned off, as forking them
+with the server's threads running isn't safe.
+"""
+from __future__ import unicode_literals, print_function
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from pelican import Pelican
+from pelican.log import init as init_logging
+from pelican.settings import read_settings
+
+logger = logging.getLogger(__name__)
+
+
+class BuildRequest(object):
+
+    def __init__(self):
+        self.built = threading.Event()
+        self.answered = threading.Event()
+        self.result = None
+
+
+class Builder(object):
+    """Builds the site in the main thread, once for all the requests that
+    are waiting"""
+
+    def __init__(self, args):
+        self.args = args
+        self.settings = read_settings(args.settings, override={
+            'PATH': os.path.abspath(args.path),
+            'OUTPUT_PATH': os.path.abspath(args.output),
+        })
+        # The parallel_reader plugin forks its workers, which could wait
+        # forever on a lock held by one of the server's threads
+        self.settings['PARALLEL_READER'] = dict(self.settings.get('PARALLEL_READER', {}), processes=1)
+        self.pelican = Pelican(self.settings)
+        self.sources = self.source_state()
+
+        self.condition = threading.Condition()
+        self.waiting = []
+
+    def source_state(self):
+        """Modification times of the settings and the plugins' modules"""
+        paths = [self.args.settings]
+        for top in self.settings.get('PLUGIN_PATHS', []):
+            for root, dirs, files in os.walk(top):
+                paths.extend(os.path.join(root, name) for name in files if name.endswith('.py'))
+        return dict((path, os.stat(path).st_mtime) for path in paths if os.path.exists(path))
+
+    def uses_settings(self, path):
+        return os.path.realpath(path) == os.path.realpath(self.args.settings)
+
+    def request(self):
+        """Called by the server's threads, waits for the next build"""
+        request = BuildRequest()
+        with self.condition:
+            self.waiting.append(request)
+            self.condition.notify()
+        request.built.wait()
+        return request
+
+    def build(self):
+        start = time.time()
+        try:
+            self.pelican.run()
+        except Exception as e:
+            logger.exception("builder: build failed")
+            return 'error %s' % ('%s' % e).replace('\n', ' ')
+        return 'ok %.2f' % (time.time() - start)
+
+    def serve(self):
+        """Builds until a restart is needed, and returns True then"""
+        while True:
+            with self.condition:
+                while not self.waiting:
+                    # A timeout keeps the wait interruptible
+                    self.condition.wait(1)
+            # Let the rest of a burst of changes arrive
+            time.sleep(self.args.delay)
+            with self.condition:
+                requests, self.waiting = self.waiting, []
+
+            if self.source_state() != self.sources:
+                with self.condition:
+                    self.waiting[:0] = requests
+                return True
+            self.answer(requests, self.build())
+
+    def answer(self, requests, result):
+        for request in requests:
+            request.result = result
+            request.built.set()
+
+    def release(self):
+        """Tells the requests still waiting to ask again after a restart"""
+        with self.condition:
+            requests, self.waiting = self.waiting, []
+        self.answer(requests, 'restart')
+        for request in requests:
+            request.answered.wait(5)
+
+
+class BuildRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            command, _, settings = line.decode('utf-8').strip().partition(' ')
+            if command != 'build':
+                self.wfile.write(('error unknown command %s\n' % command).encode('utf-8'))
+                continue
+            if settings and not self.server.builder.uses_settings(settings):
+                self.wfile.write(('error the builder is running with %s, not %s\n' % (
+                    self.server.builder.args.settings, settings)).encode('utf-8'))
+                continue
+            request = self.server.builder.request()
+            try:
+                self.wfile.write((request.result + '\n').encode('utf-8'))
+                self.wfile.flush()
+            finally:
+                request.answered.set()
+            if request.result == 'restart':
+                return
+
+
+class BuildServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path', help='Path where to find the content files.')
+    parser.add_argument('-o', '--output', default='output', help='Where to output the generated files.')
+    parser.add_argument('-s', '--settings', required=True, help='The settings of the application.')
+    parser.add_argument('--host', default='127.0.0.1', help='The address to listen on.')
+    parser.add_argument('--port', type=int, default=8010, help='The port to listen on.')
+    parser.add_argument('--delay', type=float, default=0.1,
+                        help='Seconds to wait for more requests before building.')
+    parser.add_argument('-D', '--debug', action='store_const', const=logging.DEBUG,
+                        dest='verbosity', default=logging.WARNING, help='Show all messages.')
+    parser.add_argument('-v', '--verbose', action='store_const', const=logging.INFO,
+                        dest='verbosity', help='Show all messages but debug ones.')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    init_logging(args.verbosity)
+
+    builder = Builder(args)
+    server = BuildServer((args.host, args.port), BuildRequestHandler)
+    server.builder = builder
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    logger.info("builder: listening on %s:%d", args.host, args.port)
+
+    try:
+        restart = builder.serve()
+    except KeyboardInterrupt:
+        restart = False
+    server.shutdown()
+    if restart:
+        builder.release()
+    server.server_close()
+
+    if restart:
+        logger.warning("builder: settings or plugins changed, restarting")
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*- #
 from __future__ import unicode_literals
 import os
+import sys
 
 from pygments.formatters.html import _escape_html_table
 
@@ -62,10 +63,31 @@ DEFAULT_PAGINATION = 20
 PLUGIN_PATHS = [
     os.path.join(BASEDIR, 'plugins'),
 ]
+# The plugins import the modules they share, embeds and disk_cache, from the
+# plugin paths. Pelican 3 puts them on the path, pelican 4 doesn't
+sys.path.extend(path for path in PLUGIN_PATHS if path not in sys.path)
+
 PLUGINS = [
-    'youtube', 'sitemap', 'jsfiddle', 'render_math', 'gist', 'neighbors'
+    'youtube', 'sitemap', 'jsfiddle', 'render_math', 'gist', 'neighbors',
+    'incremental', 'parallel_reader', 'rst_cache',
 ]
 
+# Render the articles and pages in a pool of processes, one per CPU unless
+# 'processes' says otherwise
+PARALLEL_READER = {
+    'processes': None,
+}
+
+# Outside of PATH, so that the plugins writing to the cache don't set off the
+# watchers of the sources
+CACHE_PATH = os.path.join(os.path.dirname(BASEDIR), 'cache')
+
+# When developing, only write what a change affects, and keep what the
+# readers made of unchanged sources between builds
+if DEBUG:
+    CACHE_CONTENT = True
+    LOAD_CONTENT_CACHE = True
+
 SITEMAP = {
     'format': 'xml',
 }
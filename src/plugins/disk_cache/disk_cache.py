@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Disk Cache
+==========
+The size-bounded, on-disk cache that the render_math and rst_cache plugins
+keep their entries in, and the settings hash that they and the incremental
+plugin use to tell whether the settings changed between builds.
+
+Entries are files named after their key. When the cache grows beyond its
+size limit, the least recently used entries are evicted. Hits refresh the
+mtime of an entry, which is what orders them.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+from collections import OrderedDict
+from logging import warning
+
+
+def settings_hash(settings, ignored=()):
+    """Hashes pelican's settings, minus the ignored ones"""
+    def name(value):
+        return getattr(value, 'pattern', None) or getattr(value, '__name__', None) or type(value).__name__
+
+    settings = dict((key, value) for key, value in settings.items() if key not in ignored)
+    try:
+        text = json.dumps(settings, sort_keys=True, default=name)
+    except TypeError:
+        text = repr(sorted(settings.items(), key=lambda item: item[0]))
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class DiskCache(object):
+    """On-disk LRU cache of bytes. Messages are prefixed with log_prefix"""
+
+    def __init__(self, path, max_size, log_prefix):
+        self.path = path
+        self.max_size = max_size
+        self.log_prefix = log_prefix
+        self.hits = 0
+        self.misses = 0
+        self.scan()
+
+    def scan(self):
+        """Counts the entries on disk, which other processes may have added
+        to, and evicts what doesn't fit"""
+        # name -> size, least recently used first
+        self.entries = OrderedDict()
+        self.size = 0
+
+        if os.path.isdir(self.path):
+            found = []
+            for name in os.listdir(self.path):
+                try:
+                    stat = os.stat(os.path.join(self.path, name))
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, name, stat.st_size))
+            for _, name, size in sorted(found):
+                self.entries[name] = size
+                self.size += size
+            # The size limit may have been lowered since the last build
+            self.evict()
+
+    def read(self, name):
+        """Returns the bytes cached under name, or None"""
+        if name not in self.entries:
+            self.misses += 1
+            return None
+
+        path = os.path.join(self.path, name)
+        try:
+            with open(path, 'rb') as fd:
+                data = fd.read()
+            os.utime(path, None)
+        except (IOError, OSError):
+            # Removed behind our back
+            self.size -= self.entries.pop(name)
+            self.misses += 1
+            return None
+
+        self.entries[name] = self.entries.pop(name)
+        self.hits += 1
+        return data
+
+    def write(self, name, data):
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                # Made by another process in the meantime
+                if not os.path.isdir(self.path):
+                    raise
+        # Written aside and renamed, as processes may share the cache
+        fd, temporary = tempfile.mkstemp(dir=self.path, prefix='.')
+        with os.fdopen(fd, 'wb') as fd:
+            fd.write(data)
+        getattr(os, 'replace', os.rename)(temporary, os.path.join(self.path, name))
+
+        if name in self.entries:
+            self.size -= self.entries.pop(name)
+        self.entries[name] = len(data)
+        self.size += self.entries[name]
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits"""
+        while self.size > self.max_size and len(self.entries) > 1:
+            name, size = self.entries.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                warning("%s: unable to evict %s from the cache" % (self.log_prefix, name))
@@ -0,0 +1 @@
+from .embeds import *
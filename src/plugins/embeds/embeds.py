@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Embeds
+======
+Renders the players that the youtube, vimeo and jsfiddle plugins embed, for
+their reStructuredText directives and for the gist plugin's shortcodes, so
+that both give the same markup for the same settings.
+
+Each player is set up from the settings named after it (YOUTUBE, VIMEO or
+JSFIDDLE) when pelican is initialized. With 'facade', a lightweight
+placeholder is rendered instead of the player, and swapped for it by
+assets/js/embeds.js. Videos may also be sized and titled from their oEmbed
+metadata, and given a poster, which are fetched into the cache once and
+copied to the output from there.
+"""
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import time
+
+from logging import warning
+
+try:
+    from urllib.request import urlopen
+    from urllib.error import URLError
+except ImportError:
+    from urllib2 import urlopen, URLError
+
+try:
+    from html import escape
+except ImportError:
+    from cgi import escape
+
+
+def facade_block(url, link, width, height, poster, title, trigger):
+    """A placeholder with a play button, swapped for the player by the
+    page's script on click, or when it scrolls into view"""
+    style = 'width:{}px;height:{}px'.format(width, height)
+    if poster:
+        style += ";background-image:url('{}')".format(poster)
+    return '<div class="embed-facade" data-src="{}" data-width="{}" '\
+           'data-height="{}" data-trigger="{}" data-autoplay="1" style="{}">'\
+           '<a class="embed-facade-play" href="{}" title="{}">Play</a></div>'.format(
+               url, width, height, trigger, style, link, escape(title, True))
+
+
+def css_length(value):
+    """Unitless lengths are in pixels"""
+    return '{}px'.format(value) if str(value).isdigit() else value
+
+
+def fiddle_facade_block(url, link, width, height, trigger):
+    """A placeholder with a run button, swapped for the fiddle by the
+    page's script on click, or when it scrolls into view"""
+    style = 'width:{};height:{}'.format(css_length(width), css_length(height))
+    return '<div class="embed-facade" data-src="{}" data-width="{}" data-height="{}" '\
+           'data-trigger="{}" style="{}"><a class="embed-facade-play" href="{}">Run</a></div>'.format(
+               url, width, height, trigger, style, link)
+
+
+class Player(object):
+    """A video player, set up from the settings named after it"""
+
+    def __init__(self, name, embed_url, link_url, poster_url, oembed_url):
+        self.name = name
+        self.embed_url = embed_url
+        self.link_url = link_url
+        self.poster_url = poster_url
+        self.oembed_url = oembed_url
+        self.settings = self.configure({})
+
+    def configure(self, pelican_settings):
+        """Returns the settings of the player, given pelican's"""
+        settings = {
+            'facade': False,
+            'trigger': 'click',
+            'poster_url': self.poster_url,
+            'poster_path': '{}/embeds'.format(pelican_settings.get('THEME_STATIC_DIR', 'theme')),
+            'cache_path': os.path.join(pelican_settings.get('CACHE_PATH', 'cache'), self.name),
+            'timeout': 10,
+            'oembed': False,
+            'oembed_url': self.oembed_url,
+            'oembed_ttl': 7 * 24 * 60 * 60,
+        }
+        settings.update(pelican_settings.get(self.name.upper(), {}))
+        settings['siteurl'] = pelican_settings.get('SITEURL', '')
+        return settings
+
+    def init(self, pelicanobj):
+        """Sets up the player according to its settings"""
+        self.settings = self.configure(pelicanobj.settings)
+
+    def failed(self, cached):
+        """Whether fetching the cache entry failed within the TTL. Failures
+        aren't retried until then, so that offline builds don't wait for the
+        timeout on every render"""
+        failure = os.path.join(self.settings['cache_path'], 'failed', os.path.basename(cached))
+        try:
+            return time.time() - os.path.getmtime(failure) < self.settings['oembed_ttl']
+        except OSError:
+            return False
+
+    def fail(self, cached, what, video_id, error):
+        """Warns that fetching the cache entry failed, and records it"""
+        warning("%s plugin: unable to fetch the %s of %s (%s)" % (self.name, what, video_id, error))
+        failures = os.path.join(self.settings['cache_path'], 'failed')
+        if not os.path.isdir(failures):
+            os.makedirs(failures)
+        failure = os.path.join(failures, os.path.basename(cached))
+        with open(failure, 'w'):
+            pass
+        os.utime(failure, None)
+
+    def metadata(self, video_id):
+        """Returns the oEmbed metadata of a video, or None. It is kept in the
+        cache between builds, and fetched again once it is older than the TTL"""
+        settings = self.settings
+        if not settings['oembed']:
+            return None
+
+        cached = os.path.join(settings['cache_path'], 'oembed', '{}.json'.format(video_id))
+        try:
+            fresh = time.time() - os.path.getmtime(cached) < settings['oembed_ttl']
+        except OSError:
+            fresh = False
+
+        if not fresh and not self.failed(cached):
+            try:
+                data = json.loads(urlopen(settings['oembed_url'].format(id=video_id),
+                                          timeout=settings['timeout']).read().decode('utf-8'))
+            except (URLError, OSError, ValueError) as e:
+                self.fail(cached, 'metadata', video_id, e)
+            else:
+                if not os.path.isdir(os.path.dirname(cached)):
+                    os.makedirs(os.path.dirname(cached))
+                with open(cached, 'w') as fd:
+                    json.dump(data, fd)
+                return data
+
+        # Stale metadata is better than none
+        try:
+            with open(cached) as fd:
+                return json.load(fd)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def poster(self, video_id, meta):
+        """Returns the url of a video's poster, which is fetched once into the
+        cache, and copied from there to the output"""
+        settings = self.settings
+        if settings['poster_url']:
+            url = settings['poster_url'].format(id=video_id)
+        elif meta and meta.get('thumbnail_url'):
+            url = meta['thumbnail_url']
+        else:
+            return None
+
+        name = '{}-{}.jpg'.format(self.name, video_id)
+        cached = os.path.join(settings['cache_path'], 'posters', name)
+        if not os.path.exists(cached):
+            if self.failed(cached):
+                return url
+            try:
+                data = urlopen(url, timeout=settings['timeout']).read()
+            except (URLError, OSError) as e:
+                self.fail(cached, 'poster', video_id, e)
+                return url
+            if not os.path.isdir(os.path.dirname(cached)):
+                os.makedirs(os.path.dirname(cached))
+            with open(cached, 'wb') as fd:
+                fd.write(data)
+
+        return '{}/{}/{}'.format(settings['siteurl'], settings['poster_path'].strip('/'), name)
+
+    def render(self, video_id, width=None, height=None, align='left'):
+        """Returns the html of a video, 420x315 unless width or height say
+        otherwise or its metadata gives its aspect ratio"""
+        # Reserve the space of the video's real aspect ratio
+        meta = self.metadata(video_id) or {}
+        title = meta.get('title') or ''
+        if meta.get('width') and meta.get('height'):
+            ratio = float(meta['height']) / float(meta['width'])
+            if height is None:
+                height = int(round((width or 420) * ratio))
+            elif width is None:
+                width = int(round(height / ratio))
+        width = width or 420
+        height = height or 315
+
+        url = self.embed_url.format(id=video_id)
+        div_block = '<div class="{}" align="{}">'.format(self.name, align)
+        if self.settings['facade']:
+            embed_block = facade_block(
+                url, self.link_url.format(id=video_id), width, height,
+                self.poster(video_id, meta), title, self.settings['trigger'])
+        elif title:
+            embed_block = '<iframe width="{}" height="{}" src="{}" title="{}" '\
+                          'frameborder="0"></iframe>'.format(width, height, url, escape(title, True))
+        else:
+            embed_block = '<iframe width="{}" height="{}" src="{}" '\
+                          'frameborder="0"></iframe>'.format(width, height, url)
+        return div_block + embed_block + '</div>'
+
+    def copy_posters(self, pelicanobj):
+        """Copies the cached posters to the output. All of them are copied, as
+        content read from pelican's cache doesn't render its players"""
+        settings = self.settings
+        posters = os.path.join(settings['cache_path'], 'posters')
+        if not settings['facade'] or not os.path.isdir(posters):
+            return
+
+        path = os.path.join(pelicanobj.output_path, *settings['poster_path'].strip('/').split('/'))
+        for name in os.listdir(posters):
+            target = os.path.join(path, name)
+            if not os.path.exists(target):
+                if not os.path.isdir(path):
+                    os.makedirs(path)
+                shutil.copyfile(os.path.join(posters, name), target)
+
+
+class Fiddle(object):
+    """A JSFiddle, set up from the JSFIDDLE settings"""
+
+    name = 'jsfiddle'
+
+    def __init__(self):
+        self.settings = self.configure({})
+
+    def configure(self, pelican_settings):
+        settings = {
+            'facade': False,
+            'trigger': 'click',
+        }
+        settings.update(pelican_settings.get('JSFIDDLE', {}))
+        return settings
+
+    def init(self, pelicanobj):
+        """Sets up the fiddle according to the JSFIDDLE settings"""
+        self.settings = self.configure(pelicanobj.settings)
+
+    def render(self, fiddle_id, width='100%', height='300',
+               tabs='js,resources,html,css,result', skin='light'):
+        """Returns the html of a fiddle"""
+        url = 'http://jsfiddle.net/{}/embedded/{}/{}/'.format(fiddle_id, tabs, skin)
+        div_block = '<div class="jsfiddle">'
+        if self.settings['facade']:
+            embed_block = fiddle_facade_block(
+                url, 'https://jsfiddle.net/{}/'.format(fiddle_id),
+                width, height, self.settings['trigger'])
+        else:
+            embed_block = '<iframe width="{}" height="{}" src="{}" allowfullscreen="allowfullscreen" '\
+                          'frameborder="0"></iframe>'.format(width, height, url)
+        return div_block + embed_block + '</div>'
+
+
+YOUTUBE = Player(
+    'youtube',
+    embed_url='https://www.youtube.com/embed/{id}',
+    link_url='https://www.youtube.com/watch?v={id}',
+    poster_url='https://i.ytimg.com/vi/{id}/hqdefault.jpg',
+    oembed_url='https://www.youtube.com/oembed?format=json&url=https://www.youtube.com/watch?v={id}')
+
+VIMEO = Player(
+    'vimeo',
+    embed_url='https://player.vimeo.com/video/{id}',
+    link_url='https://vimeo.com/{id}',
+    poster_url='',
+    oembed_url='https://vimeo.com/api/oembed.json?url=https://vimeo.com/{id}')
+
+JSFIDDLE = Fiddle()
+
+PLAYERS = [YOUTUBE, VIMEO, JSFIDDLE]
+
+
+def init(pelicanobj):
+    """Sets up every player according to its settings"""
+    for player in PLAYERS:
+        player.init(pelicanobj)
+
+
+def copy_posters(pelicanobj):
+    """Copies the cached posters of every video player to the output"""
+    for player in PLAYERS:
+        if isinstance(player, Player):
+            player.copy_posters(pelicanobj)
@@ -1,15 +1,103 @@
+import os
 import re
 
 from pelican import signals
 
+from .snapshot import GistSnapshots
 
-def gist(content):
-    """Converts [[ gist username:ID ]] in an article into its embedded <script> equivalent."""
-    if content and content._content:
-        pattern = r'\[\[ gist (\w+):(\w+) \]\]'
-        replacement = r'<script src="https://gist.github.com/\1/\2.js"></script>'
-        content._content = re.sub(pattern, replacement, content._content)
+import embeds
+
+# Every shortcode starts with this, so content without it isn't scanned
+SHORTCODE_PREFIX = '[[ '
+
+# [[ name argument ]], expanded by the function registered for name
+SHORTCODE_RE = re.compile(r'\[\[ (\w+) ([^\s\]]+) \]\]')
+
+GIST_RE = re.compile(r'(\w+):(\w+)$')
+YOUTUBE_RE = re.compile(r'[\w-]+$')
+VIMEO_RE = re.compile(r'\d+$')
+JSFIDDLE_RE = re.compile(r'[\w-]+(?:/[\w-]+)*$')
+
+
+def gist(argument):
+    """Converts a username:ID argument into its embedded <script> equivalent,
+    or into its highlighted code when gists are snapshotted."""
+    match = GIST_RE.match(argument)
+    if match:
+        if gist.snapshots is not None:
+            html = gist.snapshots.render(match.group(2))
+            if html is not None:
+                return html
+        return '<script src="https://gist.github.com/{}/{}.js"></script>'.format(*match.groups())
+
+gist.snapshots = None
+
+
+def youtube(argument):
+    """Embeds a YouTube video as the youtube directive does without options."""
+    if YOUTUBE_RE.match(argument):
+        return embeds.YOUTUBE.render(argument)
+
+
+def vimeo(argument):
+    """Embeds a Vimeo video as the vimeo directive does without options."""
+    if VIMEO_RE.match(argument):
+        return embeds.VIMEO.render(argument)
+
+
+def jsfiddle(argument):
+    """Embeds a JSFiddle as the jsfiddle directive does without options."""
+    if JSFIDDLE_RE.match(argument):
+        return embeds.JSFIDDLE.render(argument)
+
+
+SHORTCODES = {
+    'gist': gist,
+    'youtube': youtube,
+    'vimeo': vimeo,
+    'jsfiddle': jsfiddle,
+}
+
+
+def expand(match):
+    """Returns the html for a shortcode, or the shortcode itself if it isn't
+    one we know or its argument isn't valid."""
+    expander = SHORTCODES.get(match.group(1))
+    html = expander(match.group(2)) if expander else None
+    return match.group(0) if html is None else html
+
+
+def shortcodes(content):
+    """Converts [[ gist username:ID ]], [[ youtube ID ]], [[ vimeo ID ]] and
+    [[ jsfiddle ID ]] in an article into their embedded equivalents, in a
+    single scan of its content."""
+    text = getattr(content, '_content', None)
+    if text and SHORTCODE_PREFIX in text:
+        content._content = SHORTCODE_RE.sub(expand, text)
+
+
+def gist_init(pelicanobj):
+    """Sets up gist snapshots according to the GIST settings, and the
+    players of the other shortcodes according to theirs"""
+    embeds.init(pelicanobj)
+
+    settings = {
+        'snapshot': False,
+        'cache_path': os.path.join(pelicanobj.settings.get('CACHE_PATH', 'cache'), 'gist'),
+        'api_url': 'https://api.github.com/gists/',
+        'timeout': 10,
+        'check': True,
+    }
+    settings.update(pelicanobj.settings.get('GIST', {}))
+
+    gist.snapshots = None
+    if settings['snapshot']:
+        gist.snapshots = GistSnapshots(
+            settings['cache_path'], settings['api_url'],
+            settings['timeout'], settings['check'])
 
 
 def register():
-    signals.content_object_init.connect(gist)
+    signals.initialized.connect(gist_init)
+    signals.content_object_init.connect(shortcodes)
+    signals.finalized.connect(embeds.copy_posters)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Gist Snapshots
+==============
+Fetches gists at build time and keeps them in a cache directory, so that
+pages show their code as static highlighted html instead of loading it with
+a render-blocking script from gist.github.com.
+
+Each build asks the API whether a cached gist has changed, sending the ETag
+of its snapshot, and only fetches it again when it has a new revision. When
+the API can't be reached, cached snapshots are used as they are.
+"""
+from __future__ import unicode_literals
+
+import json
+import os
+import re
+
+from codecs import open
+from logging import warning
+
+try:
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError, URLError
+except ImportError:
+    from urllib2 import Request, urlopen, HTTPError, URLError
+
+try:
+    from html import escape
+except ImportError:
+    from cgi import escape
+
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import get_lexer_by_name, guess_lexer_for_filename, TextLexer
+from pygments.util import ClassNotFound
+
+# GitHub's anchors for the files of a gist
+ANCHOR_RE = re.compile(r'[^a-z0-9]+')
+
+
+def get_lexer(name, language, content):
+    try:
+        return get_lexer_by_name((language or '').lower())
+    except ClassNotFound:
+        pass
+    try:
+        return guess_lexer_for_filename(name, content)
+    except ClassNotFound:
+        return TextLexer()
+
+
+class GistSnapshots(object):
+    """Snapshots of gists, cached on disk between builds"""
+
+    def __init__(self, path, api_url, timeout=10, check=True):
+        self.path = path
+        self.api_url = api_url.rstrip('/') + '/'
+        self.timeout = timeout
+        self.check = check
+        self.formatter = HtmlFormatter(cssclass='highlight')
+
+        # Snapshots used in this build, so that each gist is checked once
+        self.snapshots = {}
+
+    def load(self, gist_id):
+        try:
+            with open(os.path.join(self.path, gist_id + '.json'), 'r', encoding='utf-8') as fd:
+                return json.load(fd)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def save(self, snapshot):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        with open(os.path.join(self.path, snapshot['id'] + '.json'), 'w', encoding='utf-8') as fd:
+            fd.write(json.dumps(snapshot, sort_keys=True))
+
+    def read(self, url, headers=None):
+        response = urlopen(Request(url, headers=headers or {}), timeout=self.timeout)
+        return response.read().decode('utf-8'), response.info().get('ETag')
+
+    def fetch(self, gist_id, cached):
+        """Returns the latest snapshot of a gist, or the cached one if it hasn't
+        changed or can't be fetched"""
+        headers = {'Accept': 'application/vnd.github.v3+json', 'User-Agent': 'pelican-gist'}
+        if cached and cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+
+        try:
+            body, etag = self.read(self.api_url + gist_id, headers)
+            data = json.loads(body)
+            history = data.get('history') or [{}]
+            revision = history[0].get('version') or data.get('updated_at')
+            if cached and cached['revision'] == revision:
+                return cached
+
+            files = []
+            for name, details in sorted(data['files'].items()):
+                content = details.get('content')
+                # Large files are left out of the API's response
+                if content is None or details.get('truncated'):
+                    content, _ = self.read(details['raw_url'])
+                files.append({'name': name, 'language': details.get('language'), 'content': content})
+        except HTTPError as e:
+            if e.code != 304:
+                warning("gist plugin: unable to fetch gist %s (%s)" % (gist_id, e))
+            return cached
+        except (URLError, OSError, ValueError, KeyError) as e:
+            warning("gist plugin: unable to fetch gist %s (%s)" % (gist_id, e))
+            return cached
+
+        snapshot = {
+            'id': gist_id,
+            'revision': revision,
+            'etag': etag,
+            'url': data.get('html_url') or 'https://gist.github.com/' + gist_id,
+            'files': files,
+        }
+        self.save(snapshot)
+        return snapshot
+
+    def get(self, gist_id):
+        """Returns the snapshot of a gist, or None if there is none"""
+        if gist_id not in self.snapshots:
+            snapshot = self.load(gist_id)
+            if self.check or snapshot is None:
+                snapshot = self.fetch(gist_id, snapshot)
+            self.snapshots[gist_id] = snapshot
+        return self.snapshots[gist_id]
+
+    def render(self, gist_id):
+        """Returns the highlighted code of a gist, or None if there is no
+        snapshot of it"""
+        snapshot = self.get(gist_id)
+        if snapshot is None:
+            return None
+
+        html = ['<div class="gist" id="gist-%s">' % gist_id]
+        for details in snapshot['files']:
+            name, content = details['name'], details['content']
+            url = '%s#file-%s' % (snapshot['url'], ANCHOR_RE.sub('-', name.lower()))
+            html.append('<div class="gist-file">')
+            html.append(highlight(content, get_lexer(name, details['language'], content), self.formatter))
+            html.append('<div class="gist-meta"><a href="%s">%s</a></div>' % (
+                escape(url, True), escape(name)))
+            html.append('</div>')
+        html.append('</div>')
+        return ''.join(html)
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+'''
+Incremental
+-----------
+
+The incremental plugin records which output files depend on which sources,
+and on the next build only writes the outputs affected by the sources that
+have changed since.
+'''
+
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import os
+
+from logging import info
+from codecs import open
+
+from pelican import signals
+
+from disk_cache import settings_hash
+
+# Content attributes that decide where content is written and how it is
+# linked to. When one changes, the whole site is written again
+STRUCTURE_ATTRIBUTES = ['date', 'category', 'slug', 'status', 'tags', 'lang',
+                        'save_as', 'authors']
+
+# Generator attributes holding content
+CONTENT_LISTS = ['articles', 'translations', 'drafts', 'drafts_translations',
+                 'hidden_articles', 'hidden_translations', 'pages',
+                 'hidden_pages', 'draft_pages', 'draft_translations']
+
+# Outputs that list content rather than show a single article or page
+LISTING = '*'
+
+# Settings the plugin sets itself
+OWN_SETTINGS = ['WRITE_SELECTED', 'LOAD_CONTENT_CACHE']
+
+
+def tree_hash(paths):
+    """Hashes the names, sizes and mtimes of the files under some directories"""
+    state = []
+    for top in paths:
+        for root, dirs, files in os.walk(top):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(('.pyc', '.pyo')):
+                    continue
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                state.append('%s %d %d' % (path, stat.st_size, stat.st_mtime))
+    return hashlib.sha1('\n'.join(state).encode('utf-8')).hexdigest()
+
+
+def source_state(content):
+    """Returns the hash of a content's source and of its structure"""
+    with open(content.source_path, 'rb') as fd:
+        source = hashlib.sha1(fd.read()).hexdigest()
+    structure = []
+    for attribute in STRUCTURE_ATTRIBUTES:
+        value = getattr(content, attribute, None)
+        if isinstance(value, (list, tuple)):
+            value = sorted('%s' % item for item in value)
+        elif hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        elif value is not None:
+            value = '%s' % value
+        structure.append(value)
+    return [source, hashlib.sha1(json.dumps(structure).encode('utf-8')).hexdigest()]
+
+
+def content_sources(content):
+    """Sources of a content and of the content it links to"""
+    sources = set([content.source_path])
+    sources.update(translation.source_path for translation in getattr(content, 'translations', []))
+    for name in dir(content):
+        if name.startswith(('next_article', 'prev_article')):
+            neighbor = getattr(content, name, None)
+            if neighbor is not None and hasattr(neighbor, 'source_path'):
+                sources.add(neighbor.source_path)
+    return sources
+
+
+class IncrementalBuild(object):
+
+    def __init__(self, settings, output_path, write_selected, settings_digest):
+        self.settings = settings
+        self.settings_digest = settings_digest
+        self.output_path = output_path
+        self.path = settings.get('INCREMENTAL', {}).get(
+            'manifest', os.path.join(settings.get('CACHE_PATH', 'cache'), 'incremental.json'))
+
+        # Paths on the command line or in the settings are left alone
+        self.write_selected = write_selected
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fd:
+                self.manifest = json.load(fd)
+        except (IOError, OSError, ValueError):
+            self.manifest = None
+
+        self.sources = {}
+        self.outputs = {}
+        self.selected = None
+
+    def environment_hash(self):
+        paths = [self.settings['THEME']]
+        paths.extend(self.settings.get('PLUGIN_PATHS', []))
+        paths.extend(self.settings.get('THEME_TEMPLATES_OVERRIDES', []))
+        return '%s %s' % (self.settings_digest, tree_hash(paths))
+
+    def use_content_cache(self, load):
+        """Keeps pelican from loading what its readers made of the sources in
+        an earlier build, when the settings, theme or plugins have changed
+        since and the readers may make something else of them"""
+        self.environment = self.environment_hash()
+        if load and (not self.manifest or self.manifest['environment'] != self.environment):
+            info("incremental plugin: settings, theme or plugins changed, reading every source again")
+            load = False
+        self.settings['LOAD_CONTENT_CACHE'] = load
+
+    def select(self, generators):
+        """Works out which outputs need writing, and restricts pelican's
+        writer to them"""
+        for generator in generators:
+            for name in CONTENT_LISTS:
+                for content in getattr(generator, name, []) or []:
+                    if getattr(content, 'source_path', None) and os.path.isfile(content.source_path):
+                        self.sources[content.source_path] = source_state(content)
+
+        self.settings['WRITE_SELECTED'] = self.write_selected
+        if self.write_selected or not self.manifest:
+            return
+        if self.manifest['environment'] != self.environment:
+            info("incremental plugin: settings, theme or plugins changed, writing everything")
+            return
+
+        old_sources = self.manifest['sources']
+        if set(old_sources) != set(self.sources):
+            info("incremental plugin: content added or removed, writing everything")
+            return
+
+        changed = set()
+        for path, state in self.sources.items():
+            if state[1] != old_sources[path][1]:
+                info("incremental plugin: %s moved or retagged, writing everything" % path)
+                return
+            if state[0] != old_sources[path][0]:
+                changed.add(path)
+
+        selected = []
+        for output, sources in self.manifest['outputs'].items():
+            path = os.path.join(self.output_path, output)
+            if not os.path.exists(path):
+                info("incremental plugin: %s is missing, writing everything" % output)
+                return
+            if changed and (sources == LISTING or changed.intersection(sources)):
+                selected.append(output)
+
+        info("incremental plugin: writing %d of %d outputs" % (len(selected), len(self.manifest['outputs'])))
+        self.selected = selected
+        # Depending on its version, pelican's writer checks feeds by their
+        # relative path, and other files by their joined or absolute path.
+        # An empty list would write everything
+        paths = [os.path.abspath(self.path)]
+        for output in selected:
+            path = os.path.join(self.output_path, output)
+            paths.extend([output, path, os.path.abspath(path)])
+        self.settings['WRITE_SELECTED'] = paths
+
+    def written(self, path, context):
+        """Records the sources an output depends on"""
+        output = os.path.relpath(path, self.output_path)
+        content = context.get('article') or context.get('page')
+        if content is not None and hasattr(content, 'source_path'):
+            self.outputs[output] = sorted(content_sources(content))
+        else:
+            self.outputs[output] = LISTING
+
+    def save(self):
+        self.settings['WRITE_SELECTED'] = self.write_selected
+        if self.write_selected:
+            # Only what was asked for was written, so the manifest is left
+            # as it is, for the next build to write what changed since
+            return
+
+        if self.selected is not None:
+            # Outputs that weren't written this time are still up to date
+            outputs = dict(self.manifest['outputs'])
+            outputs.update(self.outputs)
+        else:
+            outputs = self.outputs
+            # Outputs of content that no longer exists
+            for output in set((self.manifest or {}).get('outputs', {})) - set(outputs):
+                path = os.path.join(self.output_path, output)
+                if os.path.exists(path):
+                    info("incremental plugin: removing stale %s" % output)
+                    os.remove(path)
+                    directory = os.path.dirname(os.path.abspath(path))
+                    while directory != os.path.abspath(self.output_path) and not os.listdir(directory):
+                        os.rmdir(directory)
+                        directory = os.path.dirname(directory)
+
+        manifest = {
+            'environment': self.environment,
+            'sources': self.sources,
+            'outputs': outputs,
+        }
+        if manifest == self.manifest:
+            # Nothing changed, and a rewrite would wake up anything watching
+            # the cache
+            return
+        if not os.path.isdir(os.path.dirname(os.path.abspath(self.path))):
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)))
+        with open(self.path, 'w', encoding='utf-8') as fd:
+            json.dump(manifest, fd, sort_keys=True)
+
+
+def build_init(pelicanobj):
+    build_init.write_selected = list(pelicanobj.settings.get('WRITE_SELECTED') or [])
+    build_init.load_content_cache = pelicanobj.settings.get('LOAD_CONTENT_CACHE', False)
+    build_init.settings_digest = None
+
+
+def start_build(pelicanobj):
+    """Starts a build, which pelican runs again and again when autoreloading,
+    before the generators load the content cache"""
+    if build_init.settings_digest is None:
+        # Pelican's readers add to the settings, the markdown extensions for
+        # example, so they are hashed as they were before the first build
+        build_init.settings_digest = settings_hash(pelicanobj.settings, OWN_SETTINGS)
+    select_outputs.build = IncrementalBuild(
+        pelicanobj.settings, pelicanobj.output_path, build_init.write_selected,
+        build_init.settings_digest)
+    select_outputs.build.use_content_cache(build_init.load_content_cache)
+
+
+def select_outputs(generators):
+    if select_outputs.build is not None:
+        select_outputs.build.select(generators)
+
+select_outputs.build = None
+
+
+def output_written(path, context=None, **kwargs):
+    if select_outputs.build is not None:
+        select_outputs.build.written(path, context or {})
+
+
+def save_manifest(pelicanobj):
+    if select_outputs.build is not None:
+        select_outputs.build.save()
+        select_outputs.build = None
+
+
+def register():
+    signals.initialized.connect(build_init)
+    signals.get_generators.connect(start_build)
+    signals.all_generators_finalized.connect(select_outputs)
+    signals.content_written.connect(output_written)
+    if hasattr(signals, 'feed_written'):
+        signals.feed_written.connect(output_written)
+    signals.finalized.connect(save_manifest)
@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+
 from docutils import nodes
 from docutils.parsers.rst import directives, Directive
 
+from pelican import signals
+
+import embeds
+
 
 def comma_seperated_multiple_choices(argument, values):
     try:
@@ -54,6 +59,10 @@ class JSFiddle(Directive):
     .. jsfiddle:: if1live/V2P28
         :width: 100%
         :height: 300
+
+    With JSFIDDLE = {'facade': True}, a lightweight placeholder is output
+    instead, and swapped for the fiddle by assets/js/embeds.js when it is
+    clicked, or when it scrolls into view if 'trigger' is 'visible'.
     """
     required_arguments = 1
     optional_arguments = 4
@@ -69,22 +78,15 @@ class JSFiddle(Directive):
 
     def run(self):
         fiddle_id = self.arguments[0].strip()
-
-        width = self.options.get('width', '100%')
-        height = self.options.get('height', '300')
-        tabs = self.options.get('tabs', 'js,resources,html,css,result')
-        skin = self.options.get('skin', 'light')
-
-        url = 'http://jsfiddle.net/{}/embedded/{}/{}/'.format(fiddle_id, tabs, skin)
-        div_block = '<div class="jsfiddle">'
-        embed_block = '<iframe width="{}" height="{}" src="{}" allowfullscreen="allowfullscreen" frameborder="0"></iframe>'.format(width, height, url)
-
-        return [
-            nodes.raw('', div_block, format='html'),
-            nodes.raw('', embed_block, format='html'),
-            nodes.raw('', '</div>', format='html')
-        ]
+        html = embeds.JSFIDDLE.render(
+            fiddle_id,
+            width=self.options.get('width', '100%'),
+            height=self.options.get('height', '300'),
+            tabs=self.options.get('tabs', 'js,resources,html,css,result'),
+            skin=self.options.get('skin', 'light'))
+        return [nodes.raw('', html, format='html')]
 
 
 def register():
     directives.register_directive('jsfiddle', JSFiddle)
+    signals.initialized.connect(embeds.JSFIDDLE.init)
@@ -6,53 +6,83 @@ Neighbor Articles Plugin for Pelican
 This plugin adds ``next_article`` (newer) and ``prev_article`` (older)
 variables to the article's context
 """
+from operator import attrgetter
+
 from pelican import signals
 
 
-def iter3(seq):
-    it = iter(seq)
-    nxt = None
-    cur = next(it)
-    for prv in it:
-        yield nxt, cur, prv
-        nxt, cur = cur, prv
-    yield nxt, cur, None
+def get_languages(articles):
+    """Maps each article to its translations by language"""
+    languages = {}
+    for article in articles:
+        # The first translation in a language wins
+        languages[id(article)] = dict(
+            (translation.lang, translation)
+            for translation in reversed(article.translations))
+    return languages
+
 
+def link(newer, older, next_name, prev_name, languages):
+    """Makes two articles, either of which may be None, neighbors"""
+    if newer:
+        setattr(newer, prev_name, older)
+        translations = languages[id(older)] if older else {}
+        for translation in newer.translations:
+            setattr(translation, prev_name, translations.get(translation.lang, older))
+    if older:
+        setattr(older, next_name, newer)
+        translations = languages[id(newer)] if newer else {}
+        for translation in older.translations:
+            setattr(translation, next_name, translations.get(translation.lang, newer))
 
-def get_translation(article, prefered_language):
-    if not article:
-        return None
-    for translation in article.translations:
-        if translation.lang == prefered_language:
-            return translation
-    return article
 
+def set_neighbors(articles, next_name, prev_name, languages):
+    newer = None
+    for article in articles:
+        link(newer, article, next_name, prev_name, languages)
+        newer = article
+    link(newer, None, next_name, prev_name, languages)
 
-def set_neighbors(articles, next_name, prev_name):
-    for nxt, cur, prv in iter3(articles):
-        setattr(cur, next_name, nxt)
-        setattr(cur, prev_name, prv)
 
-        for translation in cur.translations:
-            setattr(translation, next_name, get_translation(nxt, translation.lang))
-            setattr(translation, prev_name, get_translation(prv, translation.lang))
+def is_date_ordered(articles):
+    return all(articles[i].date >= articles[i + 1].date
+               for i in range(len(articles) - 1))
 
 
 def neighbors(generator):
-    set_neighbors(generator.articles, 'next_article', 'prev_article')
-
-    for category, articles in generator.categories:
-        articles.sort(key=(lambda x: x.date), reverse=(True))
-        set_neighbors(
-            articles, 'next_article_in_category', 'prev_article_in_category')
-
-    if hasattr(generator, 'subcategories'):
-        for subcategory, articles in generator.subcategories:
-            articles.sort(key=(lambda x: x.date), reverse=(True))
-            index = subcategory.name.count('/')
-            next_name = 'next_article_in_subcategory{}'.format(index)
-            prev_name = 'prev_article_in_subcategory{}'.format(index)
-            set_neighbors(articles, next_name, prev_name)
+    # Shared by the global, category and subcategory orderings
+    languages = get_languages(generator.articles)
+
+    set_neighbors(generator.articles, 'next_article', 'prev_article', languages)
+
+    # Category and subcategory lists follow the order of the articles, which
+    # is newest first unless ARTICLE_ORDER_BY says otherwise, so a single
+    # pass over them in date order links the neighbors within every group
+    articles = generator.articles
+    if not is_date_ordered(articles):
+        articles = sorted(articles, key=attrgetter('date'), reverse=True)
+
+    subcategories = {}
+    for subcategory, members in getattr(generator, 'subcategories', ()):
+        index = subcategory.name.count('/')
+        group = ('next_article_in_subcategory{}'.format(index),
+                 'prev_article_in_subcategory{}'.format(index),
+                 subcategory.name)
+        for article in members:
+            subcategories.setdefault(id(article), []).append(group)
+
+    # Newest article seen so far in each group
+    newest = {}
+    for article in articles:
+        groups = [('next_article_in_category', 'prev_article_in_category',
+                   article.category)]
+        groups.extend(subcategories.get(id(article), ()))
+        for group in groups:
+            link(newest.get(group), article, group[0], group[1], languages)
+            newest[group] = article
+
+    for group, article in newest.items():
+        link(article, None, group[0], group[1], languages)
 
 
 def register():
@@ -0,0 +1 @@
+from .parallel_reader import register
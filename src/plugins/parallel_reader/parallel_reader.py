@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+'''
+Parallel Reader
+---------------
+
+The parallel reader plugin renders the sources of the articles and pages in
+a pool of processes, before pelican reads them one at a time. Pelican then
+gets each rendered source from the pool instead of rendering it itself, and
+builds the content objects in its own process and in its own order, so the
+generators and the plugins' signals see the same content as they otherwise
+would.
+'''
+
+from __future__ import unicode_literals
+
+import multiprocessing
+import os
+import pickle
+
+from logging import info, warning
+
+from pelican import signals
+
+
+def render(path):
+    """Renders a source in a worker, returning the pickled (content,
+    metadata) of its reader, or None if that fails, so that pelican reads it
+    itself and reports the error"""
+    extension = os.path.splitext(path)[1][1:]
+    try:
+        return pickle.dumps(render.readers[extension].read(path), pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return None
+
+# The readers of the generator being read, inherited by the workers
+render.readers = None
+
+
+def fork_pool(processes):
+    """Returns a pool of forked processes, which start out with the plugins
+    initialized as they are here, or None if processes can't be forked"""
+    if not hasattr(os, 'fork'):
+        return None
+    if not hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.Pool(processes)
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context('fork').Pool(processes)
+
+
+def pre_render(generator, paths, excludes):
+    """Renders the sources of a generator that pelican would have to read"""
+    readers = generator.readers.readers
+    sources = []
+    for path in generator.get_files(generator.settings[paths], exclude=generator.settings[excludes]):
+        source = os.path.abspath(os.path.join(generator.path, path))
+        reader = readers.get(os.path.splitext(path)[1][1:])
+        if reader is None or not getattr(reader, 'enabled', True):
+            continue
+        # Sources cached by pelican aren't read again
+        if generator.get_cached_data(path, None) is not None:
+            continue
+        if generator.readers.get_cached_data(source, (None, None))[0] is not None:
+            continue
+        # Nor are sources cached by the rst_cache plugin
+        cached = getattr(reader.read, 'cached', None)
+        if cached is not None and cached(source):
+            continue
+        sources.append(source)
+
+    processes = min(pre_render.settings['processes'] or multiprocessing.cpu_count(), len(sources))
+    if processes < 2:
+        return
+
+    render.readers = readers
+    pool = fork_pool(processes)
+    if pool is None:
+        warning("parallel_reader plugin: processes can't be forked here, reading sources one at a time")
+        return
+    try:
+        # map keeps the order of the sources
+        results = pool.map(render, sources)
+    finally:
+        pool.close()
+        pool.join()
+        render.readers = None
+
+    rendered = {}
+    for source, result in zip(sources, results):
+        if result is not None:
+            rendered[source] = pickle.loads(result)
+    info("parallel_reader plugin: rendered %d sources in %d processes" % (len(rendered), processes))
+
+    for reader in set(readers.values()):
+        reader.read = pre_rendered(reader.read, rendered)
+
+pre_render.settings = {'processes': None}
+
+
+def pre_rendered(read, rendered):
+    """Wraps the read method of a reader, to return what the pool rendered"""
+    def read_source(path):
+        if path in rendered:
+            return rendered.pop(path)
+        return read(path)
+    return read_source
+
+
+def parallel_reader_init(pelicanobj):
+    settings = {'processes': None}
+    settings.update(pelicanobj.settings.get('PARALLEL_READER', {}))
+    pre_render.settings = settings
+
+
+def read_articles(generator):
+    pre_render(generator, 'ARTICLE_PATHS', 'ARTICLE_EXCLUDES')
+
+
+def read_pages(generator):
+    pre_render(generator, 'PAGE_PATHS', 'PAGE_EXCLUDES')
+
+
+def register():
+    signals.initialized.connect(parallel_reader_init)
+    signals.article_generator_init.connect(read_articles)
+    signals.page_generator_init.connect(read_pages)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Rendered Math Cache
+===================
+A content-addressed, size-bounded cache of rendered math fragments, kept
+on disk so that it is shared between builds.
+
+Fragments are keyed on the TeX source, whether the math is displayed or
+inlined, and a hash of the settings that affect rendering. They are kept in
+a DiskCache, which evicts the least recently used ones when the cache grows
+beyond its size limit.
+"""
+
+import hashlib
+
+from disk_cache import DiskCache
+
+
+class MathCache(DiskCache):
+    """On-disk LRU cache of rendered math fragments"""
+
+    def __init__(self, path, max_size, settings_hash=''):
+        DiskCache.__init__(self, path, max_size, 'render_math')
+        self.settings_hash = settings_hash
+
+        # Fragments found this build, so repeated math isn't even read twice
+        self.fragments = {}
+
+    def key(self, tex, display):
+        source = '\0'.join([self.settings_hash, 'display' if display else 'inline', tex])
+        return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+    def get(self, tex, display):
+        """Returns the cached fragment for tex, or None"""
+        name = self.key(tex, display)
+
+        if name in self.fragments:
+            self.hits += 1
+            return self.fragments[name]
+
+        data = self.read(name)
+        if data is None:
+            return None
+        self.fragments[name] = data.decode('utf-8')
+        return self.fragments[name]
+
+    def put(self, tex, display, fragment):
+        name = self.key(tex, display)
+        self.fragments[name] = fragment
+        self.write(name, fragment.encode('utf-8'))
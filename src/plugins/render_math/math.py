@@ -31,9 +31,16 @@ the math.  See README for more details.
 """
 
 import os
+import re
 import sys
+import json
+import hashlib
+import multiprocessing
+
+from logging import info
 
 from pelican import signals, generators
+from pelican.readers import RstReader
 
 try:
     from bs4 import BeautifulSoup
@@ -45,11 +52,25 @@ try:
 except ImportError as e:
     PelicanMathJaxExtension = None
 
+from . pelican_mathjax_rst_reader import PelicanMathJaxHTMLTranslator, PelicanMathJaxRstReader
+from . cache import MathCache
+from . prerender import MathRenderer
+
 try:
     string_type = basestring
 except NameError:
     string_type = str
 
+# Fewer summaries with math than this per worker are fixed in the main
+# process, as forking the pool would cost more than it saves
+SUMMARIES_PER_WORKER = 25
+
+# Opening tag of an element whose (quoted) class list contains "math"
+MATH_TAG_RE = re.compile(
+    r'''<([a-zA-Z][\w:-]*)[^>]*?\sclass\s*=\s*'''
+    r'''(?:"(?:[^"]*\s)?math(?:\s[^"]*)?"|'(?:[^']*\s)?math(?:\s[^']*)?')[^>]*>''')
+UNQUOTED_MATH_CLASS_RE = re.compile(r'\sclass\s*=\s*math\b')
+
 
 def process_settings(pelicanobj):
     """Sets user specified MathJax settings (see README for more details)"""
@@ -76,6 +97,13 @@ def process_settings(pelicanobj):
     mathjax_settings['mathjax_font'] = 'default'  # forces mathjax to use the specified font.
     mathjax_settings['process_summary'] = BeautifulSoup is not None  # will fix up summaries if math is cut off. Requires beautiful soup
     mathjax_settings['message_style'] = 'normal'  # This value controls the verbosity of the messages in the lower left-hand corner. Set it to "none" to eliminate all messages
+    mathjax_settings['process_summary_workers'] = 1  # number of processes used to fix up summaries, 1 processes them in the main process
+    mathjax_settings['inline_script'] = False  # if set to true, the mathjax script is inlined into every page with math instead of being written once as a static asset
+    mathjax_settings['script_path'] = os.path.join(pelicanobj.settings.get('THEME_STATIC_DIR', 'theme'), 'js')  # directory of the output path the mathjax script asset is written to
+    mathjax_settings['prerender'] = False  # if set to true, math is rendered to static markup at build time and the mathjax script is only added for math that could not be rendered
+    mathjax_settings['prerender_command'] = ['tex2svg', '{inline}', '{tex}']  # command used to prerender math, '{tex}' is replaced by the TeX source and '{inline}' by --inline for inlined math
+    mathjax_settings['prerender_cache'] = os.path.join(pelicanobj.settings.get('CACHE_PATH', 'cache'), 'render_math')  # directory in which prerendered math is cached between builds
+    mathjax_settings['prerender_cache_size'] = 64 * 1024 * 1024  # size in bytes above which the least recently used prerendered math is evicted from the cache
 
     # Source for MathJax
     mathjax_settings['source'] = "'https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.0/MathJax.js?config=TeX-AMS-MML_HTMLorMML'"
@@ -150,6 +178,27 @@ def process_settings(pelicanobj):
 
             mathjax_settings[key] = value
 
+        if key == 'process_summary_workers' and isinstance(value, int) and not isinstance(value, bool):
+            mathjax_settings[key] = value if value > 0 else multiprocessing.cpu_count()
+
+        if key == 'inline_script' and isinstance(value, bool):
+            mathjax_settings[key] = value
+
+        if key == 'script_path' and isinstance(value, string_type):
+            mathjax_settings[key] = value
+
+        if key == 'prerender' and isinstance(value, bool):
+            mathjax_settings[key] = value
+
+        if key == 'prerender_command' and isinstance(value, (list, tuple)):
+            mathjax_settings[key] = list(value)
+
+        if key == 'prerender_cache' and isinstance(value, string_type):
+            mathjax_settings[key] = value
+
+        if key == 'prerender_cache_size' and isinstance(value, int) and value > 0:
+            mathjax_settings[key] = value
+
         if key == 'responsive' and isinstance(value, bool):
             mathjax_settings[key] = 'true' if value else 'false'
 
@@ -183,23 +232,106 @@ def process_settings(pelicanobj):
 
     return mathjax_settings
 
+def find_math_text(html):
+    """Returns the raw text of every math element in html, in document order,
+    without building a parse tree. Returns None if the markup is anything
+    other than flat text inside the math elements, so that the caller can
+    fall back to BeautifulSoup"""
+
+    if UNQUOTED_MATH_CLASS_RE.search(html):
+        return None
+
+    texts = []
+    for match in MATH_TAG_RE.finditer(html):
+        end = html.find('</%s>' % match.group(1), match.end())
+        if end == -1:
+            return None
+        text = html[match.end():end]
+        if '<' in text:
+            return None
+        texts.append(text)
+    return texts
+
+def fix_summary(summary_and_content):
+    """Restores math that has been cut off at the end of a summary. Takes a
+    (summary, content) pair so that it can be mapped over a process pool.
+    Returns the (possibly corrected) summary, or None if it has no math"""
+
+    summary, content = summary_and_content
+
+    # Cheap checks first: no math at all, or math that hasn't been cut off
+    if 'math' not in summary:
+        return None
+    math_text = find_math_text(summary)
+    if math_text is not None:
+        if not math_text:
+            return None
+        if not math_text[-1].endswith('...'):
+            return summary
+
+    summary_parsed = BeautifulSoup(summary, 'html.parser')
+    math = summary_parsed.find_all(class_='math')
+
+    if len(math) == 0:
+        return None
+
+    last_math_text = math[-1].get_text()
+    if len(last_math_text) > 3 and last_math_text[-3:] == '...':
+        # Only parse the full content once truncated math has been found
+        content_parsed = BeautifulSoup(content, 'html.parser')
+        full_text = content_parsed.find_all(class_='math')[len(math)-1].get_text()
+        math[-1].string = "%s ..." % full_text
+        summary = summary_parsed.decode()
+
+    return summary
+
+def set_summary(article, summary):
+    """Attaches the mathjax script to a summary returned by fix_summary"""
+    if summary is not None:
+        article._summary = summary + process_summary.mathjax_tag
+
 def process_summary(article):
     """Ensures summaries are not cut off. Also inserts
     mathjax script so that math will be rendered"""
 
-    summary = article._get_summary()
-    summary_parsed = BeautifulSoup(summary, 'html.parser')
-    math = summary_parsed.find_all(class_='math')
+    set_summary(article, fix_summary((article._get_summary(), article._content)))
 
-    if len(math) > 0:
-        last_math_text = math[-1].get_text()
-        if len(last_math_text) > 3 and last_math_text[-3:] == '...':
-            content_parsed = BeautifulSoup(article._content, 'html.parser')
-            full_text = content_parsed.find_all(class_='math')[len(math)-1].get_text()
-            math[-1].string = "%s ..." % full_text
-            summary = summary_parsed.decode()
+def process_summaries(articles):
+    """Runs process_summary over many articles, fixing the summaries in
+    batches across a pool of processes if more than one worker is set and
+    enough summaries have math"""
 
-        article._summary = "%s<script type='text/javascript'>%s</script>" % (summary, process_summary.mathjax_script)
+    workers = process_summary.workers
+    if workers <= 1 or len(articles) < 2:
+        for article in articles:
+            process_summary(article)
+        return
+
+    # Only ship articles whose summary may contain math to the pool
+    candidates = []
+    for article in articles:
+        summary = article._get_summary()
+        if 'math' in summary:
+            candidates.append((article, summary))
+
+    if len(candidates) < workers * SUMMARIES_PER_WORKER:
+        for article, summary in candidates:
+            set_summary(article, fix_summary((summary, article._content)))
+        return
+
+    pool = multiprocessing.Pool(workers)
+    try:
+        chunksize = max(1, len(candidates) // (workers * 4))
+        summaries = pool.map(fix_summary,
+                             [(summary, article._content) for article, summary in candidates],
+                             chunksize)
+    finally:
+        pool.close()
+        pool.join()
+
+    # Results come back in order, so they can be zipped onto the articles
+    for (article, _), summary in zip(candidates, summaries):
+        set_summary(article, summary)
 
 def configure_typogrify(pelicanobj, mathjax_settings):
     """Instructs Typogrify to ignore math tags - which allows Typogrify
@@ -236,20 +368,60 @@ def configure_typogrify(pelicanobj, mathjax_settings):
 def process_mathjax_script(mathjax_settings):
     """Load the mathjax script template from file, and render with the settings"""
 
-    # Read the mathjax javascript template from file
-    with open (os.path.dirname(os.path.realpath(__file__))
-            + '/mathjax_script_template', 'r') as mathjax_script_template:
-        mathjax_template = mathjax_script_template.read()
+    # Read the mathjax javascript template from file, once per process
+    if process_mathjax_script.template is None:
+        with open (os.path.dirname(os.path.realpath(__file__))
+                + '/mathjax_script_template', 'r') as mathjax_script_template:
+            process_mathjax_script.template = mathjax_script_template.read()
+
+    return process_mathjax_script.template.format(**mathjax_settings)
 
-    return mathjax_template.format(**mathjax_settings)
+process_mathjax_script.template = None
 
-def mathjax_for_markdown(pelicanobj, mathjax_script, mathjax_settings):
+def mathjax_script_asset(pelicanobj, mathjax_script, mathjax_settings):
+    """Returns the tag that loads the mathjax script, and the url it is loaded
+    from. Unless the script is inlined, it is written once as a static asset
+    named after its hash, so that browsers can cache it across pages"""
+
+    write_mathjax_script.asset = None
+
+    if mathjax_settings['inline_script']:
+        return "<script type='text/javascript'>%s</script>" % mathjax_script, ''
+
+    digest = hashlib.sha1(mathjax_script.encode('utf-8')).hexdigest()[:12]
+    path = '%s/mathjax-%s.js' % (mathjax_settings['script_path'].replace(os.sep, '/').strip('/'), digest)
+    src = '%s/%s' % (pelicanobj.settings.get('SITEURL', ''), path)
+    write_mathjax_script.asset = (path, mathjax_script)
+    return "<script type='text/javascript' src='%s'></script>" % src, src
+
+def write_mathjax_script(pelicanobj):
+    """Writes the mathjax script asset to the output path"""
+
+    if write_mathjax_script.asset is None:
+        return
+
+    path, mathjax_script = write_mathjax_script.asset
+    path = os.path.join(pelicanobj.output_path, *path.split('/'))
+
+    # The name changes with the content, so an existing file is up to date
+    if os.path.exists(path):
+        return
+
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as fd:
+        fd.write(mathjax_script)
+
+write_mathjax_script.asset = None
+
+def mathjax_for_markdown(pelicanobj, mathjax_script, mathjax_settings, mathjax_src=''):
     """Instantiates a customized markdown extension for handling mathjax
     related content"""
 
     # Create the configuration for the markdown template
     config = {}
     config['mathjax_script'] = mathjax_script
+    config['mathjax_script_src'] = mathjax_src
     config['math_tag_class'] = 'math'
     config['auto_insert'] = mathjax_settings['auto_insert']
 
@@ -264,12 +436,18 @@ def mathjax_for_markdown(pelicanobj, mathjax_script, mathjax_settings):
         sys.stderr.write("\nError - the pelican mathjax markdown extension failed to configure. MathJax is non-functional.\n")
         sys.stderr.flush()
 
-def mathjax_for_rst(pelicanobj, mathjax_script, mathjax_settings):
+def mathjax_for_rst(pelicanobj, mathjax_tag, mathjax_settings):
     """Setup math for RST"""
     docutils_settings = pelicanobj.settings.get('DOCUTILS_SETTINGS', {})
     docutils_settings.setdefault('math_output', 'MathJax %s' % mathjax_settings['source'])
     pelicanobj.settings['DOCUTILS_SETTINGS'] = docutils_settings
-    rst_add_mathjax.mathjax_script = mathjax_script
+    PelicanMathJaxHTMLTranslator.mathjax_tag = mathjax_tag
+
+def rst_add_reader(readers):
+    """Reads reStructuredText with the reader that adds the mathjax script,
+    unless it has been replaced or disabled in user settings"""
+    if readers.reader_classes.get('rst') is RstReader:
+        readers.reader_classes['rst'] = PelicanMathJaxRstReader
 
 def pelican_init(pelicanobj):
     """
@@ -284,65 +462,106 @@ def pelican_init(pelicanobj):
     # Generate mathjax script
     mathjax_script = process_mathjax_script(mathjax_settings)
 
+    # Generate the tag that loads it, inline or from a static asset
+    mathjax_tag, mathjax_src = mathjax_script_asset(pelicanobj, mathjax_script, mathjax_settings)
+
     # Configure Typogrify
     configure_typogrify(pelicanobj, mathjax_settings)
 
     # Configure Mathjax For Markdown
     if PelicanMathJaxExtension:
-        mathjax_for_markdown(pelicanobj, mathjax_script, mathjax_settings)
+        mathjax_for_markdown(pelicanobj, mathjax_script, mathjax_settings, mathjax_src)
 
     # Configure Mathjax For RST
-    mathjax_for_rst(pelicanobj, mathjax_script, mathjax_settings)
+    mathjax_for_rst(pelicanobj, mathjax_tag, mathjax_settings)
 
-    # Set process_summary's mathjax_script variable
-    process_summary.mathjax_script = None
+    # Set process_summary's mathjax_tag variable
+    process_summary.mathjax_tag = None
     if mathjax_settings['process_summary']:
-        process_summary.mathjax_script = mathjax_script
-
-def rst_add_mathjax(content):
-    """Adds mathjax script for reStructuredText"""
-
-    # .rst is the only valid extension for reStructuredText files
-    _, ext = os.path.splitext(os.path.basename(content.source_path))
-    if ext != '.rst':
+        process_summary.mathjax_tag = mathjax_tag
+    process_summary.workers = mathjax_settings['process_summary_workers']
+
+    # Set prerender_math's renderer, None leaves all math to MathJax
+    prerender_math.renderer = None
+    prerender_math.mathjax_tags = [mathjax_tag]
+    if mathjax_src:
+        # Markdown serialises attributes sorted, or in insertion order
+        prerender_math.mathjax_tags += [
+            '<script src="%s" type="text/javascript"></script>' % mathjax_src,
+            '<script type="text/javascript" src="%s"></script>' % mathjax_src]
+    else:
+        prerender_math.mathjax_tags += ['<script type="text/javascript">%s</script>' % mathjax_script]
+    if mathjax_settings['prerender']:
+        cache = MathCache(mathjax_settings['prerender_cache'],
+                          mathjax_settings['prerender_cache_size'],
+                          render_settings_hash(mathjax_settings))
+        prerender_math.renderer = MathRenderer(mathjax_settings['prerender_command'], cache)
+
+def render_settings_hash(mathjax_settings):
+    """Hashes the settings that change how math is rendered, so that cached
+    math is not reused after they change"""
+    settings = dict((key, mathjax_settings[key]) for key in
+                    ('prerender_command', 'tex_extensions', 'mathjax_font'))
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+def prerender_math(content):
+    """Renders math to static markup at build time. If all of the math has been
+    rendered, the mathjax script added by the reStructuredText reader or the
+    markdown extension is removed"""
+
+    if prerender_math.renderer is None or 'class="math"' not in content._content:
         return
 
-    # If math class is present in text, add the javascript
-    # note that RST hardwires mathjax to be class "math"
-    if 'class="math"' in content._content:
-        content._content += "<script type='text/javascript'>%s</script>" % rst_add_mathjax.mathjax_script
+    # The script is taken out while rendering, as an inlined script would
+    # look like TeX left for MathJax
+    html = content._content
+    mathjax_tag = None
+    for tag in prerender_math.mathjax_tags:
+        if html.endswith(tag):
+            html = html[:-len(tag)]
+            mathjax_tag = tag
+            break
+
+    html, unrendered = prerender_math.renderer.render_content(html)
+    if unrendered and mathjax_tag is not None:
+        html += mathjax_tag
+    content._content = html
 
 def process_rst_and_summaries(content_generators):
     """
-    Ensure mathjax script is applied to RST and summaries are
-    corrected if specified in user settings.
+    Prerender math if specified in user settings, and ensure summaries
+    are corrected if specified in user settings. The mathjax script has
+    already been added to content with math when it was read.
 
     Handles content attached to ArticleGenerator and PageGenerator objects,
     since the plugin doesn't know how to handle other Generator types.
 
-    For reStructuredText content, examine both articles and pages.
-    If article or page is reStructuredText and there is math present,
-    append the mathjax script.
-
-    Also process summaries if present (only applies to articles)
-    and user wants summaries processed (via user settings)
+    Math is prerendered in both articles and pages. Summaries are
+    processed if present (only applies to articles)
     """
 
     for generator in content_generators:
         if isinstance(generator, generators.ArticlesGenerator):
-            for article in (
+            articles = (
                     generator.articles +
                     generator.translations +
-                    generator.drafts):
-                rst_add_mathjax(article)
-                #optionally fix truncated formulae in summaries.
-                if process_summary.mathjax_script is not None:
-                    process_summary(article)
+                    generator.drafts)
+            for article in articles:
+                prerender_math(article)
+            #optionally fix truncated formulae in summaries.
+            if process_summary.mathjax_tag is not None:
+                process_summaries(articles)
         elif isinstance(generator, generators.PagesGenerator):
             for page in generator.pages:
-                rst_add_mathjax(page)
+                prerender_math(page)
+
+    if prerender_math.renderer is not None:
+        cache = prerender_math.renderer.cache
+        info("render_math: prerendered math cache: %d hits, %d misses" % (cache.hits, cache.misses))
 
 def register():
     """Plugin registration"""
     signals.initialized.connect(pelican_init)
+    signals.readers_init.connect(rst_add_reader)
     signals.all_generators_finalized.connect(process_rst_and_summaries)
+    signals.finalized.connect(write_mathjax_script)
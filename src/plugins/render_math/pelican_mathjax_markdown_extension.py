@@ -8,22 +8,119 @@ gives Pelican the ability to use Mathjax as a "first class
 citizen" of the blog
 """
 
+import re
 import markdown
 
+from collections import deque
+
 from markdown.util import etree
 from markdown.util import AtomicString
 
+# Regexes to detect mathjax. Markdown compiles inline patterns with DOTALL
+# and UNICODE, so the same flags are used here to match identically
+MATHJAX_INLINE_RE = re.compile(
+    r'(?P<prefix>\$)(?P<math>.+?)(?P<suffix>(?<!\s)(?P=prefix))',
+    re.DOTALL | re.UNICODE)
+MATHJAX_DISPLAY_RE = re.compile(
+    r'(?P<prefix>\$\$|\\begin\{(?P<env>.+?)\})(?P<math>.+?)(?P<suffix>(?P=prefix)|\\end\{(?P=env)\})',
+    re.DOTALL | re.UNICODE)
+
+class PelicanMathJaxMatch(object):
+    """Stands in for a match of the ``^(.*?)pattern(.*)$`` regex that markdown
+    wraps around inline patterns"""
+
+    def __init__(self, data, start, end, tag, groups):
+        self.data = data
+        self.start = start
+        self.end = end
+        self.tag = tag
+        self.named_groups = groups
+
+    def group(self, key):
+        if key == 1:
+            return self.data[:self.start]
+        return self.named_groups[key]
+
+    def groups(self):
+        return (self.data[:self.start], self.named_groups['prefix'],
+                self.named_groups['math'], self.named_groups['suffix'],
+                self.data[self.end:])
+
+    def span(self, idx):
+        return (self.end, len(self.data))
+
+class PelicanMathJaxTokenizer(object):
+    """Finds displayed and inlined math in a text node.
+
+    Markdown applies an inline pattern to a text node repeatedly, restarting
+    from the beginning of the text after each match has been replaced by a
+    placeholder. Rather than rescanning the text for every match, the text is
+    tokenized once and, as long as each call is the previous text with the
+    last match replaced by a placeholder, the remaining matches are handed out
+    from the tokenized result.
+
+    Displayed math is found before inlined math, exactly as when the two were
+    separate patterns registered in that order"""
+
+    def __init__(self):
+        self.data = None
+
+    def _follows(self, data):
+        """Checks data is the previous text with the last match replaced by an
+        inline placeholder"""
+        if self.data is None:
+            return False
+        prefix = self.data[:self.start]
+        suffix = self.data[self.end:]
+        return (len(data) > len(prefix) + len(suffix) and
+                data.startswith(prefix) and data.endswith(suffix) and
+                data[len(prefix)] == markdown.util.STX and
+                data[len(data) - len(suffix) - 1] == markdown.util.ETX)
+
+    def _tokenize(self, data, regex, tag):
+        self.tag = tag
+        self.offset = 0
+        self.pending = deque((m.start(), m.end(), m.groupdict()) for m in regex.finditer(data))
+
+    def match(self, data):
+        if self._follows(data):
+            # Every pending match is to the right of the last one
+            self.offset += len(data) - len(self.data)
+        elif '$' not in data and '\\begin' not in data:
+            self.data = None
+            return None
+        else:
+            self._tokenize(data, MATHJAX_DISPLAY_RE, 'div')
+
+        if not self.pending and self.tag == 'div':
+            self._tokenize(data, MATHJAX_INLINE_RE, 'span')
+
+        if not self.pending:
+            self.data = None
+            return None
+
+        start, end, groups = self.pending.popleft()
+        self.data = data
+        self.start = start + self.offset
+        self.end = end + self.offset
+        return PelicanMathJaxMatch(data, self.start, self.end, self.tag, groups)
+
 class PelicanMathJaxPattern(markdown.inlinepatterns.Pattern):
-    """Inline markdown processing that matches mathjax"""
+    """Inline markdown processing that matches mathjax, both displayed and
+    inlined, with a single tokenizer"""
 
-    def __init__(self, pelican_mathjax_extension, tag, pattern):
-        super(PelicanMathJaxPattern,self).__init__(pattern)
+    def __init__(self, pelican_mathjax_extension, md):
+        super(PelicanMathJaxPattern,self).__init__(MATHJAX_DISPLAY_RE.pattern, md)
         self.math_tag_class = pelican_mathjax_extension.getConfig('math_tag_class')
         self.pelican_mathjax_extension = pelican_mathjax_extension
-        self.tag = tag
+        self.markdown_instance = md
+        self.tokenizer = PelicanMathJaxTokenizer()
+
+    def getCompiledRegExp(self):
+        return self.tokenizer
 
     def handleMatch(self, m):
-        node = markdown.util.etree.Element(self.tag)
+        node = markdown.util.etree.Element(m.tag)
         node.set('class', self.math_tag_class)
 
         prefix = '\\(' if m.group('prefix') == '$' else m.group('prefix')
@@ -31,8 +128,9 @@ class PelicanMathJaxPattern(markdown.inlinepatterns.Pattern):
         node.text = markdown.util.AtomicString(prefix + m.group('math') + suffix)
 
         # If mathjax was successfully matched, then JavaScript needs to be added
-        # for rendering. The boolean below indicates this
-        self.pelican_mathjax_extension.mathjax_needed = True
+        # for rendering. The boolean below indicates this for the document
+        # being converted by this Markdown instance
+        self.markdown_instance.mathjax_needed = True
         return node
 
 class PelicanMathJaxCorrectDisplayMath(markdown.treeprocessors.Treeprocessor):
@@ -42,10 +140,12 @@ class PelicanMathJaxCorrectDisplayMath(markdown.treeprocessors.Treeprocessor):
     def __init__(self, pelican_mathjax_extension):
         self.pelican_mathjax_extension = pelican_mathjax_extension
 
-    def correct_html(self, root, children, div_math, insert_idx, text):
+    def correct_html(self, children, div_math, text):
         """Separates out <div class="math"> from the parent tag <p>. Anything
-        in between is put into its own parent tag of <p>"""
+        in between is put into its own parent tag of <p>. Returns the elements
+        that replace the parent, in order"""
 
+        elements = []
         current_idx = 0
 
         for idx in div_math:
@@ -55,13 +155,11 @@ class PelicanMathJaxCorrectDisplayMath(markdown.treeprocessors.Treeprocessor):
 
             # Test to ensure that empty <p> is not inserted  
             if len(el) != 0 or (el.text and not el.text.isspace()):
-               root.insert(insert_idx, el)
-               insert_idx += 1
+               elements.append(el)
 
             text = children[idx].tail
             children[idx].tail = None
-            root.insert(insert_idx, children[idx])
-            insert_idx += 1
+            elements.append(children[idx])
             current_idx = idx+1
 
         el = markdown.util.etree.Element('p')
@@ -69,52 +167,70 @@ class PelicanMathJaxCorrectDisplayMath(markdown.treeprocessors.Treeprocessor):
         el.extend(children[current_idx:])
 
         if len(el) != 0 or (el.text and not el.text.isspace()):
-            root.insert(insert_idx, el)
+            elements.append(el)
+
+        return elements
 
     def run(self, root):
         """Searches for <div class="math"> that are children in <p> tags and corrects
-        the invalid HTML that results"""
+        the invalid HTML that results. The children of root are rebuilt in a
+        single pass so that this stays linear in the size of the document"""
 
         math_tag_class = self.pelican_mathjax_extension.getConfig('math_tag_class')
 
+        rebuilt = []
+        corrected = False
+
         for parent in root:
-            div_math = []
             children = list(parent)
-
-            for div in parent.findall('div'):
-                if div.get('class') == math_tag_class:
-                    div_math.append(children.index(div))
+            div_math = [idx for idx, child in enumerate(children)
+                        if child.tag == 'div' and child.get('class') == math_tag_class]
 
             # Do not process further if no displayed math has been found
             if not div_math:
+                rebuilt.append(parent)
                 continue
 
-            insert_idx = list(root).index(parent)
-            self.correct_html(root, children, div_math, insert_idx, parent.text) 
-            root.remove(parent)  # Parent must be removed last for correct insertion index
+            rebuilt.extend(self.correct_html(children, div_math, parent.text))
+            corrected = True
+
+        if corrected:
+            # Element.clear() also drops the text, tail and attributes of root
+            text, tail, attrib = root.text, root.tail, dict(root.attrib)
+            root.clear()
+            root.text, root.tail = text, tail
+            root.attrib.update(attrib)
+            root.extend(rebuilt)
 
         return root
 
 class PelicanMathJaxAddJavaScript(markdown.treeprocessors.Treeprocessor):
     """Tree Processor for adding Mathjax JavaScript to the blog"""
 
-    def __init__(self, pelican_mathjax_extension):
+    def __init__(self, pelican_mathjax_extension, md):
         self.pelican_mathjax_extension = pelican_mathjax_extension
+        self.markdown_instance = md
 
     def run(self, root):
         # If no mathjax was present, then exit
-        if (not self.pelican_mathjax_extension.mathjax_needed):
+        if (not self.markdown_instance.mathjax_needed):
             return root
 
-        # Add the mathjax script to the html document
+        # Add the mathjax script to the html document, either inline or
+        # loaded from its static asset
         mathjax_script = etree.Element('script')
         mathjax_script.set('type','text/javascript')
-        mathjax_script.text = AtomicString(self.pelican_mathjax_extension.getConfig('mathjax_script'))
+        mathjax_src = self.pelican_mathjax_extension.getConfig('mathjax_script_src')
+        if mathjax_src:
+            mathjax_script.set('src', mathjax_src)
+            mathjax_script.text = AtomicString('')
+        else:
+            mathjax_script.text = AtomicString(self.pelican_mathjax_extension.getConfig('mathjax_script'))
         root.append(mathjax_script)
 
         # Reset the boolean switch to false so that script is only added
         # to other pages if needed
-        self.pelican_mathjax_extension.mathjax_needed = False
+        self.markdown_instance.mathjax_needed = False
         return root
 
 class PelicanMathJaxExtension(markdown.Extension):
@@ -124,30 +240,29 @@ class PelicanMathJaxExtension(markdown.Extension):
         try:
             # Needed for markdown versions >= 2.5
             self.config['mathjax_script'] = ['', 'Mathjax JavaScript script']
+            self.config['mathjax_script_src'] = ['', 'Url of the Mathjax JavaScript script, which is inlined if empty']
             self.config['math_tag_class'] = ['math', 'The class of the tag in which mathematics is wrapped']
             self.config['auto_insert'] = [True, 'Determines if mathjax script is automatically inserted into content']
             super(PelicanMathJaxExtension,self).__init__(**config)
         except AttributeError:
             # Markdown versions < 2.5
             config['mathjax_script'] = [config['mathjax_script'], 'Mathjax JavaScript script']
+            config['mathjax_script_src'] = [config.get('mathjax_script_src', ''), 'Url of the Mathjax JavaScript script, which is inlined if empty']
             config['math_tag_class'] = [config['math_tag_class'], 'The class of the tag in which mathematic is wrapped']
             config['auto_insert'] = [config['auto_insert'], 'Determines if mathjax script is automatically inserted into content']
             super(PelicanMathJaxExtension,self).__init__(config)
 
-        # Used as a flag to determine if javascript
-        # needs to be injected into a document
-        self.mathjax_needed = False
-
     def extendMarkdown(self, md, md_globals):
-        # Regex to detect mathjax
-        mathjax_inline_regex = r'(?P<prefix>\$)(?P<math>.+?)(?P<suffix>(?<!\s)\2)'
-        mathjax_display_regex = r'(?P<prefix>\$\$|\\begin\{(.+?)\})(?P<math>.+?)(?P<suffix>\2|\\end\{\3\})'
+        # Used as a flag to determine if javascript needs to be injected into
+        # a document. It is kept on the Markdown instance, not on this
+        # extension, since the extension is shared by every Markdown instance
+        # and documents may be converted concurrently on separate threads
+        md.mathjax_needed = False
 
         # Process mathjax before escapes are processed since escape processing will
-        # intefer with mathjax. The order in which the displayed and inlined math
-        # is registered below matters
-        md.inlinePatterns.add('mathjax_displayed', PelicanMathJaxPattern(self, 'div', mathjax_display_regex), '<escape')
-        md.inlinePatterns.add('mathjax_inlined', PelicanMathJaxPattern(self, 'span', mathjax_inline_regex), '<escape')
+        # intefer with mathjax. Displayed and inlined math are found by the one
+        # pattern, displayed math first
+        md.inlinePatterns.add('mathjax', PelicanMathJaxPattern(self, md), '<escape')
 
         # Correct the invalid HTML that results from teh displayed math (<div> tag within a <p> tag) 
         md.treeprocessors.add('mathjax_correctdisplayedmath', PelicanMathJaxCorrectDisplayMath(self), '>inline')
@@ -155,4 +270,4 @@ class PelicanMathJaxExtension(markdown.Extension):
         # If necessary, add the JavaScript Mathjax library to the document. This must
         # be last in the ordered dict (hence it is given the position '_end')
         if self.getConfig('auto_insert'):
-            md.treeprocessors.add('mathjax_addjavascript', PelicanMathJaxAddJavaScript(self), '_end')
+            md.treeprocessors.add('mathjax_addjavascript', PelicanMathJaxAddJavaScript(self, md), '_end')
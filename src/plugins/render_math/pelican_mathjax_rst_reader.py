@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Pelican Mathjax reStructuredText Reader
+=======================================
+A reStructuredText reader that notes math as docutils renders it, and
+adds the mathjax script to the end of the body when there was any. This
+saves searching the rendered html for math afterwards, and appending
+the script to it, which copies the whole body.
+"""
+
+import docutils.core
+import docutils.io
+
+from pelican.readers import RstReader, PelicanHTMLTranslator
+
+try:
+    from pelican.readers import PelicanHTMLWriter
+except ImportError:
+    # Pelican < 4 sets the translator in _get_publisher
+    PelicanHTMLWriter = None
+
+
+class PelicanMathJaxHTMLTranslator(PelicanHTMLTranslator):
+    """Notes whether the document has math that MathJax has to render"""
+
+    # Tag loading the mathjax script, set by the plugin
+    mathjax_tag = ''
+
+    def __init__(self, document):
+        PelicanHTMLTranslator.__init__(self, document)
+        self.mathjax_needed = False
+
+    def visit_math(self, node, *args, **kwargs):
+        # Also visited for math blocks, with a math_env argument on older
+        # docutils
+        self.mathjax_needed = True
+        PelicanHTMLTranslator.visit_math(self, node, *args, **kwargs)
+
+    def visit_raw(self, node):
+        # Raw html can carry math for MathJax too
+        if 'html' in node.get('format', '').split() and 'class="math"' in node.astext():
+            self.mathjax_needed = True
+        PelicanHTMLTranslator.visit_raw(self, node)
+
+    def depart_document(self, node):
+        # Other math_output formats are rendered without MathJax
+        if self.mathjax_needed and self.math_output == 'mathjax':
+            self.body.append(self.mathjax_tag)
+        PelicanHTMLTranslator.depart_document(self, node)
+
+if PelicanHTMLWriter is not None:
+    class PelicanMathJaxHTMLWriter(PelicanHTMLWriter):
+
+        def __init__(self):
+            PelicanHTMLWriter.__init__(self)
+            self.translator_class = PelicanMathJaxHTMLTranslator
+
+    class PelicanMathJaxRstReader(RstReader):
+        writer_class = PelicanMathJaxHTMLWriter
+
+else:
+    class PelicanMathJaxRstReader(RstReader):
+        translator_class = PelicanMathJaxHTMLTranslator
+
+        def _get_publisher(self, source_path):
+            # As pelican's own, with the translator above
+            extra_params = {'initial_header_level': '2',
+                            'syntax_highlight': 'short',
+                            'input_encoding': 'utf-8',
+                            'exit_status_level': 2,
+                            'embed_stylesheet': False}
+            user_params = self.settings.get('DOCUTILS_SETTINGS')
+            if user_params:
+                extra_params.update(user_params)
+
+            pub = docutils.core.Publisher(
+                source_class=self.FileInput,
+                destination_class=docutils.io.StringOutput)
+            pub.set_components('standalone', 'restructuredtext', 'html')
+            pub.writer.translator_class = self.translator_class
+            pub.process_programmatic_settings(None, extra_params, None)
+            pub.set_source(source_path=source_path)
+            pub.publish(enable_exit_status=True)
+            return pub
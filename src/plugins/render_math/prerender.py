@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Build-time Math Rendering
+=========================
+Renders the math elements output by docutils and the markdown extension
+to static markup (SVG by default) with a local engine, so that readers
+don't need to fetch and run MathJax to see the math.
+
+Rendered fragments are kept in a MathCache, so each distinct equation is
+only rendered once across builds.
+"""
+
+import re
+import subprocess
+
+from logging import warning
+
+try:
+    from html import unescape
+except ImportError:
+    from HTMLParser import HTMLParser
+    unescape = HTMLParser().unescape
+
+# Math elements as output by docutils (math_output MathJax) and by the
+# pelican mathjax markdown extension
+MATH_ELEMENT_RE = re.compile(r'<(span|div) class="math">(.*?)</\1>', re.DOTALL)
+
+# TeX written straight into the text, which only MathJax in the browser renders
+RAW_TEX_RE = re.compile(r'\\\(|\\\[|\$\$|\\begin\{')
+
+# Delimiters that MathJax would otherwise strip from the element text
+DELIMITERS = (('\\(', '\\)'), ('\\[', '\\]'), ('$$', '$$'))
+
+def strip_delimiters(text):
+    """Returns the TeX source of a math element's text"""
+    text = text.strip()
+    for prefix, suffix in DELIMITERS:
+        if text.startswith(prefix) and text.endswith(suffix) and len(text) >= len(prefix) + len(suffix):
+            return text[len(prefix):-len(suffix)].strip()
+    # \begin{env}...\end{env} is passed to the engine as is
+    return text
+
+class MathRenderer(object):
+    """Renders TeX with an external command, caching the output"""
+
+    def __init__(self, command, cache):
+        self.command = list(command)
+        self.cache = cache
+        self.available = True
+
+    def run_command(self, tex, display):
+        args = []
+        for arg in self.command:
+            if arg == '{inline}':
+                if not display:
+                    args.append('--inline')
+            else:
+                args.append(arg.replace('{tex}', tex))
+        return subprocess.check_output(args).decode('utf-8').strip()
+
+    def render(self, tex, display):
+        """Returns the rendered markup for tex, or None if it can't be rendered"""
+        markup = self.cache.get(tex, display)
+        if markup is not None:
+            return markup
+
+        if not self.available:
+            return None
+
+        try:
+            markup = self.run_command(tex, display)
+        except OSError as e:
+            # The engine isn't installed, leave all math to MathJax
+            warning("render_math: unable to run %s (%s), math will not be prerendered" % (self.command[0], e))
+            self.available = False
+            return None
+        except subprocess.CalledProcessError:
+            warning("render_math: unable to prerender %r" % tex)
+            return None
+
+        self.cache.put(tex, display, markup)
+        return markup
+
+    def render_content(self, html):
+        """Replaces every math element in html by its rendered markup. Returns
+        the new html and the number of math elements left unrendered, which
+        also counts TeX written directly into the text outside of them"""
+
+        unrendered = [0]
+        if RAW_TEX_RE.search(MATH_ELEMENT_RE.sub('', html)):
+            unrendered[0] += 1
+
+        def replace(match):
+            tag = match.group(1)
+            markup = self.render(strip_delimiters(unescape(match.group(2))), tag == 'div')
+            if markup is None:
+                unrendered[0] += 1
+                return match.group(0)
+            return '<%s class="math-rendered">%s</%s>' % (tag, markup, tag)
+
+        html = MATH_ELEMENT_RE.sub(replace, html)
+        return html, unrendered[0]
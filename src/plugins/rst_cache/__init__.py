@@ -0,0 +1 @@
+from .rst_cache import register
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Rendered reStructuredText Cache
+===============================
+A content-addressed, size-bounded cache of what the reStructuredText reader
+makes of a source, its html and its metadata, kept on disk so that unchanged
+sources skip docutils on the next build.
+
+Entries are keyed on the source, the settings (which include the
+DOCUTILS_SETTINGS and the math_output that render_math sets in them), the
+mathjax tag the render_math reader appends, the reader, and the versions of
+pelican, docutils and the plugins. When the cache grows beyond its size
+limit, the least recently used entries are evicted, by the DiskCache it is
+kept in.
+"""
+
+import hashlib
+import os
+import pickle
+
+from logging import info
+
+import docutils
+import pelican
+
+from pelican import signals
+from pelican.readers import RstReader
+
+from disk_cache import DiskCache, settings_hash
+
+
+class RstCache(DiskCache):
+    """On-disk LRU cache of rendered sources"""
+
+    def __init__(self, path, max_size):
+        DiskCache.__init__(self, path, max_size, 'rst_cache plugin')
+
+    def get(self, name):
+        """Returns the cached (content, metadata) for name, or None"""
+        data = self.read(name)
+        if data is None:
+            return None
+        try:
+            return pickle.loads(data)
+        except Exception:
+            return None
+
+    def put(self, name, data):
+        try:
+            serialized = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return
+        self.write(name, serialized)
+
+
+# Settings that don't change what the readers make of a source. The
+# incremental plugin sets WRITE_SELECTED and LOAD_CONTENT_CACHE for each build
+IGNORED_SETTINGS = ['WRITE_SELECTED', 'OUTPUT_PATH', 'RST_CACHE', 'PARALLEL_READER',
+                    'LOAD_CONTENT_CACHE', 'CACHE_CONTENT']
+
+
+def plugins_hash(paths):
+    """Hashes the modules of the plugins, whose directives render sources"""
+    digest = hashlib.sha1()
+    for top in paths:
+        for root, dirs, files in os.walk(top):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith('.py'):
+                    with open(os.path.join(root, name), 'rb') as fd:
+                        digest.update(fd.read())
+    return digest.hexdigest()
+
+
+def reader_hash(reader):
+    """Hashes the reader, and the mathjax tag its translator appends"""
+    writer_class = getattr(reader, 'writer_class', None)
+    if writer_class is not None:
+        translator_class = getattr(writer_class(), 'translator_class', None)
+    else:
+        # Pelican < 4 has no writer class, and the reader names its translator
+        translator_class = getattr(reader, 'translator_class', None)
+    mathjax_tag = getattr(translator_class, 'mathjax_tag', '')
+    reader_class = type(reader)
+    text = '\0'.join([reader_class.__module__, reader_class.__name__, mathjax_tag])
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def cached_read(read, environment):
+    """Wraps the read method of a reader, to go through the cache"""
+    def key(path):
+        with open(path, 'rb') as fd:
+            source = hashlib.sha1(fd.read()).hexdigest()
+        return hashlib.sha1(('%s %s' % (environment, source)).encode('utf-8')).hexdigest()
+
+    def read_source(path):
+        name = key(path)
+        data = read_source.cache.get(name)
+        if data is None:
+            data = read(path)
+            read_source.cache.put(name, data)
+        return data
+
+    def cached(path):
+        """Whether a source is in the cache, for the parallel_reader plugin
+        to leave it out of what its processes render"""
+        return key(path) in read_source.cache.entries
+
+    read_source.cache = rst_cache_init.cache
+    read_source.cached = cached
+    return read_source
+
+
+def use_cache(generator):
+    """Makes the reStructuredText readers of a generator use the cache"""
+    if rst_cache_init.cache is None:
+        return
+    if rst_cache_init.environment is None:
+        # Hashed once the plugins have changed the settings
+        settings = generator.settings
+        rst_cache_init.environment = ' '.join([
+            settings_hash(settings, IGNORED_SETTINGS),
+            plugins_hash(settings.get('PLUGIN_PATHS', [])),
+            pelican.__version__, docutils.__version__])
+    for reader in generator.readers.readers.values():
+        if isinstance(reader, RstReader):
+            environment = '%s %s' % (rst_cache_init.environment, reader_hash(reader))
+            reader.read = cached_read(reader.read, environment)
+
+
+def rst_cache_init(pelicanobj):
+    settings = {
+        'path': os.path.join(pelicanobj.settings.get('CACHE_PATH', 'cache'), 'rst'),
+        'max_size': 64 * 1024 * 1024,
+    }
+    settings.update(pelicanobj.settings.get('RST_CACHE', {}))
+    rst_cache_init.cache = None
+    rst_cache_init.environment = None
+    if settings['max_size'] > 0:
+        rst_cache_init.cache = RstCache(settings['path'], settings['max_size'])
+
+rst_cache_init.cache = None
+rst_cache_init.environment = None
+
+
+def report(pelicanobj):
+    cache = rst_cache_init.cache
+    if cache is not None:
+        info("rst_cache plugin: %d hits, %d misses" % (cache.hits, cache.misses))
+        cache.hits = cache.misses = 0
+        # Processes of the parallel_reader plugin add entries to copies of
+        # the cache, so the size limit is enforced on what is on disk
+        cache.scan()
+    # The settings and plugins may change before the next build
+    rst_cache_init.environment = None
+
+
+def register():
+    signals.initialized.connect(rst_cache_init)
+    signals.generator_init.connect(use_cache)
+    signals.finalized.connect(report)
@@ -10,6 +10,12 @@ from __future__ import unicode_literals
 
 import re
 import collections
+import codecs
+import gzip
+import hashlib
+import itertools
+import json
+import os
 import os.path
 
 from datetime import datetime
@@ -45,6 +51,34 @@ XML_FOOTER = """
 </urlset>
 """
 
+XML_INDEX_HEADER = """<?xml version="1.0" encoding="utf-8"?>
+<sitemapindex xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+xsi:schemaLocation="http://www.sitemaps.org/schemas/sitemap/0.9 http://www.sitemaps.org/schemas/sitemap/0.9/siteindex.xsd"
+xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+"""
+
+XML_INDEX_URL = """
+<sitemap>
+<loc>{0}/{1}</loc>
+<lastmod>{2}</lastmod>
+</sitemap>
+"""
+
+XML_INDEX_FOOTER = """
+</sitemapindex>
+"""
+
+# Limits imposed by the sitemap protocol on a single sitemap file
+MAX_URLS_PER_SITEMAP = 50000
+MAX_BYTES_PER_SITEMAP = 50 * 1024 * 1024
+
+# Number of formatted urls buffered before they are handed to writelines
+WRITE_BATCH = 1024
+
+STANDARD_PAGE_URLS = ['index.html', 'archives.html', 'tags.html', 'categories.html']
+
+FakePage = collections.namedtuple('FakePage', ['status', 'date', 'url', 'save_as'])
+
 
 def format_date(date):
     if date.tzinfo:
@@ -54,6 +88,190 @@ def format_date(date):
         tz = "-00:00"
     return date.strftime("%Y-%m-%dT%H:%M:%S") + tz
 
+
+def compile_url_template(siteurl, chfreq, pri):
+    """Splits XML_URL around the loc and lastmod fields, with the constant
+    fields already filled in, so that a url entry is built by concatenation"""
+    template = XML_URL.format(siteurl, '\x00', '\x01', chfreq, pri)
+    head, rest = template.split('\x00')
+    mid, tail = rest.split('\x01')
+    return head, mid, tail
+
+
+def compile_exclude(patterns):
+    """Combines the SITEMAP['exclude'] regexes into a single compiled matcher
+    so that each url is matched once instead of once per rule"""
+    if not patterns:
+        return None
+    compiled = [re.compile(p) for p in patterns]
+    one_by_one = lambda url: any(c.match(url) for c in compiled)
+    default_flags = re.compile('').flags
+    if any(c.groups or c.flags != default_flags for c in compiled):
+        # Combining renumbers groups, which would point backreferences at
+        # the wrong ones, and named groups can't appear twice. Global flags
+        # such as (?i) are an error in the middle of a pattern, or apply
+        # to every rule on older pythons
+        return one_by_one
+    try:
+        return re.compile('|'.join('(?:{0})'.format(p) for p in patterns)).match
+    except re.error:
+        return one_by_one
+
+
+def walk_output(output_path):
+    """Returns the set of all files below ``output_path``, relative to it"""
+    found = set()
+    for dirpath, dirnames, filenames in os.walk(output_path):
+        reldir = os.path.relpath(dirpath, output_path)
+        for filename in filenames:
+            found.add(os.path.normpath(os.path.join(reldir, filename)))
+    return found
+
+
+def file_hash(path):
+    """Returns the sha1 hex digest of the file at ``path``"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def replace_if_changed(tmp_path, path):
+    """Moves ``tmp_path`` over ``path`` unless both have the same content, in
+    which case the existing file (and its mtime) is kept"""
+    if os.path.exists(path):
+        if file_hash(path) == file_hash(tmp_path):
+            os.remove(tmp_path)
+            return False
+        os.remove(path)
+    os.rename(tmp_path, path)
+    return True
+
+
+class SitemapManifest(object):
+    """Persists the output hash and lastmod of every sitemap entry between
+    builds so that lastmod only moves when the output actually changes"""
+
+    def __init__(self, path, now):
+        self.path = path
+        self.now = format_date(now)
+        self.previous = {'urls': {}, 'files': {}}
+        self.current = {'urls': {}, 'files': {}}
+
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as fd:
+                    self.previous.update(json.load(fd))
+            except (IOError, ValueError):
+                warning("sitemap plugin: unable to read manifest " + path)
+
+    def lastmod(self, section, key, path):
+        digest = file_hash(path)
+        entry = self.previous[section].get(key)
+        if entry and entry['hash'] == digest:
+            lastmod = entry['lastmod']
+        else:
+            lastmod = self.now
+        self.current[section][key] = {'hash': digest, 'lastmod': lastmod}
+        return lastmod
+
+    def save(self):
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with open(self.path, 'w', encoding='utf-8') as fd:
+            json.dump(self.current, fd, indent=0, sort_keys=True)
+
+
+class SitemapShardWriter(object):
+    """Writes sitemap urls into ``sitemap-N.<format>[.gz]`` files, starting
+    a new shard whenever the current one reaches the url or size limit"""
+
+    def __init__(self, output_path, fmt, siteurl, max_urls, compress=False,
+                 incremental=False):
+        self.output_path = output_path
+        self.format = fmt
+        self.siteurl = siteurl
+        self.max_urls = max_urls
+        self.max_bytes = MAX_BYTES_PER_SITEMAP
+        self.compress = compress
+        self.incremental = incremental
+        self.shards = []
+        self.pending = []
+        self.fd = None
+        self.path = None
+        self.count = 0
+        self.size = 0
+
+    def _open_shard(self):
+        name = 'sitemap-{0}.{1}'.format(len(self.shards) + 1, self.format)
+        if self.compress:
+            name += '.gz'
+        path = self.path = os.path.join(self.output_path, name)
+        info('writing {0}'.format(path))
+
+        if self.incremental:
+            # Unchanged shards are left untouched on close
+            path += '.tmp'
+
+        if self.compress:
+            # A fixed mtime keeps the compressed output reproducible
+            raw = gzip.GzipFile(path, 'wb', mtime=0)
+            self.fd = codecs.getwriter('utf-8')(raw)
+        else:
+            self.fd = open(path, 'w', encoding='utf-8')
+
+        self.shards.append(name)
+        self.count = 0
+        self.size = 0
+
+        if self.format == 'xml':
+            self._write(XML_HEADER)
+        elif len(self.shards) == 1:
+            header = TXT_HEADER.format(self.siteurl)
+            self._write(header)
+            self.count += header.count('\n')
+
+    def _close_shard(self):
+        if self.format == 'xml':
+            self._write(XML_FOOTER)
+        self._flush()
+        self.fd.close()
+        self.fd = None
+        if self.incremental:
+            replace_if_changed(self.path + '.tmp', self.path)
+
+    def _write(self, text):
+        self.pending.append(text)
+        self.size += len(text.encode('utf-8'))
+        if len(self.pending) >= WRITE_BATCH:
+            self._flush()
+
+    def _flush(self):
+        self.fd.writelines(self.pending)
+        del self.pending[:]
+
+    def write(self, text):
+        footer = len(XML_FOOTER) if self.format == 'xml' else 0
+        if self.fd is not None and (
+                self.count >= self.max_urls or
+                self.size + len(text.encode('utf-8')) + footer > self.max_bytes):
+            self._close_shard()
+        if self.fd is None:
+            self._open_shard()
+        self._write(text)
+        self.count += 1
+
+    def close(self):
+        if self.fd is None and not self.shards:
+            # Always produce at least one (empty) sitemap for the index
+            self._open_shard()
+        if self.fd is not None:
+            self._close_shard()
+        return self.shards
+
+
 class SitemapGenerator(object):
 
     def __init__(self, context, settings, path, theme, output_path, *null):
@@ -61,6 +279,11 @@ class SitemapGenerator(object):
         self.output_path = output_path
         self.context = context
         self.now = datetime.now()
+        self.manifest = None
+
+        # Article lastmods keyed on id(article), filled in by cache_lastmods
+        self.lastmods = {}
+        self.aggregate_lastmods = {}
         self.siteurl = settings.get('SITEURL')
 
 
@@ -83,6 +306,19 @@ class SitemapGenerator(object):
         }
 
         self.sitemapExclude = []
+        self.exclude = None
+
+        # Populated by generate_output, once the other generators have written
+        self.output_files = None
+
+        # Built on first use from the final priorities and changefreqs
+        self.url_templates = None
+        self.formatted_dates = {}
+
+        # Streaming mode writes rotating sitemap-N shards and a sitemap_index.xml
+        self.sharded = False
+        self.max_urls = MAX_URLS_PER_SITEMAP
+        self.compress = False
 
         config = settings.get('SITEMAP', {})
 
@@ -93,6 +329,23 @@ class SitemapGenerator(object):
             pris = config.get('priorities')
             chfreqs = config.get('changefreqs')
             self.sitemapExclude = config.get('exclude', [])
+            self.exclude = compile_exclude(self.sitemapExclude)
+            self.sharded = bool(config.get('sharded', False))
+            self.compress = bool(config.get('gzip', False))
+
+            if config.get('incremental', False):
+                manifest_path = config.get('manifest', os.path.join(
+                    settings.get('CACHE_PATH', 'cache'), 'sitemap-manifest.json'))
+                self.manifest = SitemapManifest(manifest_path, self.now)
+            max_urls = config.get('max_urls', MAX_URLS_PER_SITEMAP)
+
+            if isinstance(max_urls, int) and 0 < max_urls <= MAX_URLS_PER_SITEMAP:
+                self.max_urls = max_urls
+            else:
+                warning("sitemap plugin: SITEMAP['max_urls'] must be an integer"
+                        " between 1 and {0}".format(MAX_URLS_PER_SITEMAP))
+                warning("sitemap plugin: setting SITEMAP['max_urls'] on "
+                        "{0}".format(MAX_URLS_PER_SITEMAP))
 
             if fmt not in ('xml', 'txt'):
                 warning("sitemap plugin: SITEMAP['format'] must be `txt' or `xml'")
@@ -134,49 +387,79 @@ class SitemapGenerator(object):
                 warning("sitemap plugin: using the default values")
 
     def write_url(self, page, fd):
+        url = self.format_url(page)
+        if url:
+            fd.write(url)
+
+    def format_url(self, page):
+        """Returns the sitemap entry for ``page``, or None if it is excluded"""
 
         if getattr(page, 'status', 'published') != 'published':
-            return
+            return None
 
         # We can disable categories/authors/etc by using False instead of ''
         if not page.save_as:
-            return
+            return None
 
-        page_path = os.path.join(self.output_path, page.save_as)
-        if not os.path.exists(page_path):
-            return
+        if self.output_files is None:
+            self.output_files = walk_output(self.output_path)
+        if os.path.normpath(page.save_as) not in self.output_files:
+            return None
 
-        lastdate = getattr(page, 'date', self.now)
-        try:
-            lastdate = self.get_date_modified(page, lastdate)
-        except ValueError:
-            warning("sitemap plugin: " + page.save_as + " has invalid modification date,")
-            warning("sitemap plugin: using date value as lastmod.")
-        lastmod = format_date(lastdate)
+        pageurl = '' if page.url == 'index.html' else page.url
+
+        #Exclude URLs from the sitemap:
+        if self.format == 'xml' and self.exclude and self.exclude(pageurl):
+            return None
+
+        lastdate = getattr(page, 'date', None)
+        if id(page) in self.lastmods:
+            lastmod = self.format_date(self.lastmods[id(page)])
+        elif lastdate is None and not hasattr(page, 'modified'):
+            # Nothing in the metadata says when this page last changed
+            lastmod = self.tracked_lastmod(page)
+        else:
+            lastdate = lastdate or self.now
+            try:
+                lastdate = self.get_date_modified(page, lastdate)
+            except ValueError:
+                warning("sitemap plugin: " + page.save_as + " has invalid modification date,")
+                warning("sitemap plugin: using date value as lastmod.")
+            lastmod = self.format_date(lastdate)
+
+        if self.format != 'xml':
+            return self.siteurl + '/' + pageurl + '\n'
+
+        if self.url_templates is None:
+            self.url_templates = dict(
+                (k, compile_url_template(self.siteurl, self.changefreqs[k],
+                                         self.priorities[k]))
+                for k in ('articles', 'pages', 'indexes'))
 
         if isinstance(page, contents.Article):
-            pri = self.priorities['articles']
-            chfreq = self.changefreqs['articles']
+            head, mid, tail = self.url_templates['articles']
         elif isinstance(page, contents.Page):
-            pri = self.priorities['pages']
-            chfreq = self.changefreqs['pages']
+            head, mid, tail = self.url_templates['pages']
         else:
-            pri = self.priorities['indexes']
-            chfreq = self.changefreqs['indexes']
+            head, mid, tail = self.url_templates['indexes']
 
-        pageurl = '' if page.url == 'index.html' else page.url
-        
-        #Exclude URLs from the sitemap:
-        if self.format == 'xml':
-            flag = False
-            for regstr in self.sitemapExclude:
-                if re.match(regstr, pageurl):
-                    flag = True
-                    break
-            if not flag:
-                fd.write(XML_URL.format(self.siteurl, pageurl, lastmod, chfreq, pri))
-        else:
-            fd.write(self.siteurl + '/' + pageurl + '\n')
+        return ''.join((head, pageurl, mid, lastmod, tail))
+
+    def format_date(self, date):
+        """Memoised format_date, many urls share the same lastmod"""
+        try:
+            return self.formatted_dates[date]
+        except KeyError:
+            formatted = self.formatted_dates[date] = format_date(date)
+            return formatted
+
+    def tracked_lastmod(self, page):
+        """Returns the time the output of ``page`` last changed, as recorded
+        in the manifest, or the build time when not building incrementally"""
+        if self.manifest is None:
+            return self.format_date(self.now)
+        path = os.path.join(self.output_path, page.save_as)
+        return self.manifest.lastmod('urls', page.save_as, path)
 
     def get_date_modified(self, page, default):
         if hasattr(page, 'modified'):
@@ -186,64 +469,154 @@ class SitemapGenerator(object):
         else:
             return default
 
+    def article_lastmod(self, article):
+        try:
+            lastmod = self.get_date_modified(article, article.date)
+        except ValueError:
+            warning("sitemap plugin: " + article.save_as + " has invalid modification date,")
+            warning("sitemap plugin: using date value as lastmod.")
+            lastmod = article.date
+        self.lastmods[id(article)] = lastmod
+        return lastmod
+
+    def aggregate_lastmod(self, article):
+        """Returns the lastmod of ``article`` as used for its category, tags
+        and authors, normalised to the site timezone"""
+        lastmod = max(article.date.replace(tzinfo=self.timezone),
+                      self.article_lastmod(article).replace(tzinfo=self.timezone))
+        self.aggregate_lastmods[id(article)] = lastmod
+        return lastmod
+
+    def cache_lastmods(self):
+        """Computes the lastmod of every article and translation in a single
+        pass, parsing each ``modified`` metadata only once"""
+        for article in self.context['articles']:
+            self.aggregate_lastmod(article)
+            for translation in article.translations:
+                self.article_lastmod(translation)
+
     def set_url_wrappers_modification_date(self, wrappers):
+        floor = datetime.min.replace(tzinfo=self.timezone)
+        cached = self.aggregate_lastmods
         for (wrapper, articles) in wrappers:
-            lastmod = datetime.min.replace(tzinfo=self.timezone)
+            lastmod = floor
             for article in articles:
-                lastmod = max(lastmod, article.date.replace(tzinfo=self.timezone))
-                try:
-                    modified = self.get_date_modified(article, datetime.min).replace(tzinfo=self.timezone)
-                    lastmod = max(lastmod, modified)
-                except ValueError:
-                    # Supressed: user will be notified.
-                    pass
-            setattr(wrapper, 'modified', str(lastmod))
+                modified = cached.get(id(article))
+                if modified is None:
+                    modified = self.aggregate_lastmod(article)
+                if modified > lastmod:
+                    lastmod = modified
+            setattr(wrapper, 'modified', lastmod)
+
+    def iter_pages(self):
+        """Yields every page that may appear in the sitemap without building
+        an intermediate list"""
+
+        for standard_page_url in STANDARD_PAGE_URLS:
+            yield FakePage(status='published',
+                           date=None,
+                           url=standard_page_url,
+                           save_as=standard_page_url)
+
+        for page in itertools.chain(
+                self.context['pages'],
+                self.context['articles'],
+                (c for (c, a) in self.context['categories']),
+                (t for (t, a) in self.context['tags']),
+                (a for (a, b) in self.context['authors'])):
+            yield page
+
+        for article in self.context['articles']:
+            for translation in article.translations:
+                yield translation
 
     def generate_output(self, writer):
-        path = os.path.join(self.output_path, 'sitemap.{0}'.format(self.format))
+        self.output_files = walk_output(self.output_path)
 
-        pages = self.context['pages'] + self.context['articles'] \
-                + [ c for (c, a) in self.context['categories']] \
-                + [ t for (t, a) in self.context['tags']] \
-                + [ a for (a, b) in self.context['authors']]
+        self.cache_lastmods()
+        self.set_url_wrappers_modification_date(itertools.chain(
+            self.context['categories'],
+            self.context['tags'],
+            self.context['authors']))
 
-        self.set_url_wrappers_modification_date(self.context['categories'])
-        self.set_url_wrappers_modification_date(self.context['tags'])
-        self.set_url_wrappers_modification_date(self.context['authors'])
+        if self.sharded:
+            self.write_sharded()
+        else:
+            self.write_single()
 
-        for article in self.context['articles']:
-            pages += article.translations
+        if self.manifest is not None:
+            self.manifest.save()
 
+    def open_output(self, path):
         info('writing {0}'.format(path))
+        if self.manifest is not None:
+            # Written aside and only moved into place if the content changed
+            path += '.tmp'
+        return open(path, 'w', encoding='utf-8')
+
+    def close_output(self, fd, path):
+        fd.close()
+        if self.manifest is not None:
+            replace_if_changed(path + '.tmp', path)
+
+    def write_single(self):
+        path = os.path.join(self.output_path, 'sitemap.{0}'.format(self.format))
 
-        with open(path, 'w', encoding='utf-8') as fd:
+        fd = self.open_output(path)
 
-            if self.format == 'xml':
-                fd.write(XML_HEADER)
+        if self.format == 'xml':
+            fd.write(XML_HEADER)
+        else:
+            fd.write(TXT_HEADER.format(self.siteurl))
+
+        rows = []
+        for page in self.iter_pages():
+            url = self.format_url(page)
+            if url:
+                rows.append(url)
+                if len(rows) >= WRITE_BATCH:
+                    fd.writelines(rows)
+                    del rows[:]
+        fd.writelines(rows)
+
+        if self.format == 'xml':
+            fd.write(XML_FOOTER)
+
+        self.close_output(fd, path)
+
+    def write_sharded(self):
+        shard_writer = SitemapShardWriter(self.output_path, self.format,
+                                          self.siteurl, self.max_urls,
+                                          self.compress,
+                                          self.manifest is not None)
+        for page in self.iter_pages():
+            url = self.format_url(page)
+            if url:
+                shard_writer.write(url)
+        shards = shard_writer.close()
+
+        self.remove_stale_shards(shards)
+
+        path = os.path.join(self.output_path, 'sitemap_index.xml')
+
+        fd = self.open_output(path)
+        fd.write(XML_INDEX_HEADER)
+        for name in shards:
+            if self.manifest is not None:
+                shard_path = os.path.join(self.output_path, name)
+                lastmod = self.manifest.lastmod('files', name, shard_path)
             else:
-                fd.write(TXT_HEADER.format(self.siteurl))
-
-            FakePage = collections.namedtuple('FakePage',
-                                              ['status',
-                                               'date',
-                                               'url',
-                                               'save_as'])
-
-            for standard_page_url in ['index.html',
-                                      'archives.html',
-                                      'tags.html',
-                                      'categories.html']:
-                fake = FakePage(status='published',
-                                date=self.now,
-                                url=standard_page_url,
-                                save_as=standard_page_url)
-                self.write_url(fake, fd)
-
-            for page in pages:
-                self.write_url(page, fd)
-
-            if self.format == 'xml':
-                fd.write(XML_FOOTER)
+                lastmod = format_date(self.now)
+            fd.write(XML_INDEX_URL.format(self.siteurl, name, lastmod))
+        fd.write(XML_INDEX_FOOTER)
+        self.close_output(fd, path)
+
+    def remove_stale_shards(self, shards):
+        """Removes shards left over from a previous, larger build"""
+        pattern = re.compile(r'^sitemap-\d+\.(xml|txt)(\.gz)?$')
+        for name in os.listdir(self.output_path):
+            if pattern.match(name) and name not in shards:
+                os.remove(os.path.join(self.output_path, name))
 
 
 def get_generators(generators):
@@ -24,6 +24,10 @@ from __future__ import unicode_literals
 from docutils import nodes
 from docutils.parsers.rst import directives, Directive
 
+from pelican import signals
+
+import embeds
+
 
 class Vimeo(Directive):
     """ Embed Vimeo video in posts.
@@ -58,29 +62,13 @@ class Vimeo(Directive):
 
     def run(self):
         videoID = self.arguments[0].strip()
-        width = 420
-        height = 315
-        align = 'left'
-
-        if 'width' in self.options:
-            width = self.options['width']
-
-        if 'height' in self.options:
-            height = self.options['height']
-
-        if 'align' in self.options:
-            align = self.options['align']
-
-        url = 'https://player.vimeo.com/video/{}'.format(videoID)
-        div_block = '<div class="vimeo" align="{}">'.format(align)
-        embed_block = '<iframe width="{}" height="{}" src="{}" '\
-                      'frameborder="0"></iframe>'.format(width, height, url)
-
-        return [
-            nodes.raw('', div_block, format='html'),
-            nodes.raw('', embed_block, format='html'),
-            nodes.raw('', '</div>', format='html')]
+        html = embeds.VIMEO.render(
+            videoID, self.options.get('width'), self.options.get('height'),
+            self.options.get('align', 'left'))
+        return [nodes.raw('', html, format='html')]
 
 
 def register():
     directives.register_directive('vimeo', Vimeo)
+    signals.initialized.connect(embeds.VIMEO.init)
+    signals.finalized.connect(embeds.VIMEO.copy_posters)
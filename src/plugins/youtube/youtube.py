@@ -24,6 +24,10 @@ from __future__ import unicode_literals
 from docutils import nodes
 from docutils.parsers.rst import directives, Directive
 
+from pelican import signals
+
+import embeds
+
 
 class YouTube(Directive):
     """ Embed YouTube video in posts.
@@ -58,29 +62,13 @@ class YouTube(Directive):
 
     def run(self):
         videoID = self.arguments[0].strip()
-        width = 420
-        height = 315
-        align = 'left'
-
-        if 'width' in self.options:
-            width = self.options['width']
-
-        if 'height' in self.options:
-            height = self.options['height']
-
-        if 'align' in self.options:
-            align = self.options['align']
-
-        url = 'https://www.youtube.com/embed/{}'.format(videoID)
-        div_block = '<div class="youtube" align="{}">'.format(align)
-        embed_block = '<iframe width="{}" height="{}" src="{}" '\
-                      'frameborder="0"></iframe>'.format(width, height, url)
-
-        return [
-            nodes.raw('', div_block, format='html'),
-            nodes.raw('', embed_block, format='html'),
-            nodes.raw('', '</div>', format='html')]
+        html = embeds.YOUTUBE.render(
+            videoID, self.options.get('width'), self.options.get('height'),
+            self.options.get('align', 'left'))
+        return [nodes.raw('', html, format='html')]
 
 
 def register():
     directives.register_directive('youtube', YouTube)
+    signals.initialized.connect(embeds.YOUTUBE.init)
+    signals.finalized.connect(embeds.YOUTUBE.copy_posters)
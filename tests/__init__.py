@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the plugins, which are run from the root of the repository with the
+python environment the site is built with::
+
+    python -m unittest discover -s tests -t .
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGINS = os.path.join(ROOT, 'src', 'plugins')
+FIXTURES = os.path.join(ROOT, 'tests', 'fixtures')
+
+# The plugins are imported as the settings make them importable, from
+# PLUGIN_PATHS
+if PLUGINS not in sys.path:
+    sys.path.insert(0, PLUGINS)
+
+
+def fixture(name):
+    """Returns the bytes of a fixture"""
+    with open(os.path.join(FIXTURES, name), 'rb') as fd:
+        return fd.read()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+A local HTTP server that stands in for the APIs the plugins fetch from,
+answering with canned responses and recording the requests it gets.
+"""
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.standin.requests.append((self.path, dict(self.headers.items())))
+        status, headers, body = self.server.standin.responses.get(self.path, (404, {}, b''))
+        if callable(body):
+            status, headers, body = body(self.headers)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandIn(object):
+    """Answers GET requests for a path with its (status, headers, body),
+    and any other path with a 404. A callable body is called with the
+    request headers, and returns the response instead"""
+
+    def __init__(self):
+        self.responses = {}
+        self.requests = []
+        self.server = HTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.standin = self
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def respond(self, path, body, status=200, headers=None):
+        self.responses[path] = (status, headers or {}, body)
+
+    def paths(self):
+        return [path for path, _ in self.requests]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from docutils.core import publish_parts
+from docutils.parsers.rst import directives
+
+from tests import fixture
+from tests.standin import StandIn
+
+import embeds
+
+from gist import gist
+from jsfiddle.jsfiddle import JSFiddle
+from vimeo.vimeo import Vimeo
+from youtube.youtube import YouTube
+
+directives.register_directive('youtube', YouTube)
+directives.register_directive('vimeo', Vimeo)
+directives.register_directive('jsfiddle', JSFiddle)
+
+
+class Pelican(object):
+    """What the players are set up from"""
+
+    def __init__(self, settings, output_path=None):
+        self.settings = settings
+        self.output_path = output_path
+
+
+class Content(object):
+
+    def __init__(self, text):
+        self._content = text
+
+
+class EmbedsTestCase(unittest.TestCase):
+    """Sets the players up with their oEmbed metadata served by a local
+    stand-in, and caches in a scratch directory"""
+
+    def setUp(self):
+        self.api = StandIn()
+        self.path = tempfile.mkdtemp()
+        self.api.respond('/youtube/oembed/tree123', fixture('youtube_oembed.json'))
+        self.api.respond('/vimeo/oembed/76979871',
+                         fixture('vimeo_oembed.json').replace(b'{url}', self.api.url.encode('utf-8')))
+
+    def tearDown(self):
+        # Back to the defaults, for the other tests
+        embeds.init(Pelican({}))
+        self.api.close()
+        shutil.rmtree(self.path)
+
+    def init(self, **settings):
+        """Sets the players up with the oEmbed settings, and any others"""
+        pelican_settings = {
+            'CACHE_PATH': self.path,
+            'SITEURL': 'https://example.com',
+            'YOUTUBE': {'oembed': True, 'oembed_url': self.api.url + '/youtube/oembed/{id}', 'timeout': 2},
+            'VIMEO': {'oembed': True, 'oembed_url': self.api.url + '/vimeo/oembed/{id}', 'timeout': 2},
+        }
+        for name, player_settings in settings.items():
+            pelican_settings.setdefault(name, {}).update(player_settings)
+        embeds.init(Pelican(pelican_settings, os.path.join(self.path, 'output')))
+
+    def directive(self, source):
+        """Returns the html of a reStructuredText directive"""
+        return publish_parts(source, writer_name='html')['body'].strip()
+
+    def shortcode(self, source):
+        """Returns the html of a shortcode in a paragraph"""
+        content = Content('<p>%s</p>' % source)
+        gist.shortcodes(content)
+        return content._content
+
+
+class RenderTest(EmbedsTestCase):
+
+    def test_youtube(self):
+        self.init()
+        html = ('<div class="youtube" align="left"><iframe width="420" height="236" '
+                'src="https://www.youtube.com/embed/tree123" title="Counting trees &amp; their rings" '
+                'frameborder="0"></iframe></div>')
+        self.assertEqual(self.directive('.. youtube:: tree123'), html)
+        self.assertEqual(self.shortcode('[[ youtube tree123 ]]'), '<p>%s</p>' % html)
+
+    def test_youtube_options(self):
+        self.init()
+        self.assertEqual(
+            self.directive('.. youtube:: tree123\n   :width: 960\n   :align: center'),
+            '<div class="youtube" align="center"><iframe width="960" height="540" '
+            'src="https://www.youtube.com/embed/tree123" title="Counting trees &amp; their rings" '
+            'frameborder="0"></iframe></div>')
+        self.assertEqual(
+            self.directive('.. youtube:: tree123\n   :width: 640\n   :height: 480'),
+            '<div class="youtube" align="left"><iframe width="640" height="480" '
+            'src="https://www.youtube.com/embed/tree123" title="Counting trees &amp; their rings" '
+            'frameborder="0"></iframe></div>')
+
+    def test_youtube_without_oembed(self):
+        self.init(YOUTUBE={'oembed': False})
+        html = ('<div class="youtube" align="left"><iframe width="420" height="315" '
+                'src="https://www.youtube.com/embed/tree123" frameborder="0"></iframe></div>')
+        self.assertEqual(self.directive('.. youtube:: tree123'), html)
+        self.assertEqual(self.shortcode('[[ youtube tree123 ]]'), '<p>%s</p>' % html)
+        self.assertEqual(self.api.requests, [])
+
+    def test_vimeo(self):
+        self.init()
+        html = ('<div class="vimeo" align="left"><iframe width="420" height="315" '
+                'src="https://player.vimeo.com/video/76979871" title="Belfast from above" '
+                'frameborder="0"></iframe></div>')
+        self.assertEqual(self.directive('.. vimeo:: 76979871'), html)
+        self.assertEqual(self.shortcode('[[ vimeo 76979871 ]]'), '<p>%s</p>' % html)
+
+    def test_jsfiddle(self):
+        self.init()
+        html = ('<div class="jsfiddle"><iframe width="100%" height="300" '
+                'src="http://jsfiddle.net/if1live/V2P28/embedded/js,resources,html,css,result/light/" '
+                'allowfullscreen="allowfullscreen" frameborder="0"></iframe></div>')
+        self.assertEqual(self.directive('.. jsfiddle:: if1live/V2P28'), html)
+        self.assertEqual(self.shortcode('[[ jsfiddle if1live/V2P28 ]]'), '<p>%s</p>' % html)
+        self.assertEqual(
+            self.directive('.. jsfiddle:: if1live/V2P28\n   :height: 500\n   :tabs: result,js\n   :skin: presentation'),
+            '<div class="jsfiddle"><iframe width="100%" height="500" '
+            'src="http://jsfiddle.net/if1live/V2P28/embedded/result,js/presentation/" '
+            'allowfullscreen="allowfullscreen" frameborder="0"></iframe></div>')
+
+    def test_facades(self):
+        self.init(YOUTUBE={'facade': True, 'poster_url': ''}, VIMEO={'facade': True},
+                  JSFIDDLE={'facade': True, 'trigger': 'visible'})
+        for directive, shortcode in [
+                ('.. youtube:: tree123', '[[ youtube tree123 ]]'),
+                ('.. vimeo:: 76979871', '[[ vimeo 76979871 ]]'),
+                ('.. jsfiddle:: if1live/V2P28', '[[ jsfiddle if1live/V2P28 ]]')]:
+            html = self.directive(directive)
+            self.assertIn('class="embed-facade"', html)
+            self.assertEqual(self.shortcode(shortcode), '<p>%s</p>' % html)
+
+    def test_invalid_shortcodes_are_left_alone(self):
+        self.init()
+        for source in ['[[ youtube not/an/id ]]', '[[ vimeo abc ]]', '[[ jsfiddle <script> ]]',
+                       '[[ unknown tree123 ]]']:
+            self.assertEqual(self.shortcode(source), '<p>%s</p>' % source)
+
+
+class FacadeTestCase(EmbedsTestCase):
+    """Sets the video players up with facades, and posters served by the
+    stand-in"""
+
+    def setUp(self):
+        super(FacadeTestCase, self).setUp()
+        self.api.respond('/posters/tree123.jpg', b'youtube poster')
+        self.api.respond('/vimeo/thumbnail/76979871.jpg', b'vimeo poster')
+
+    def init(self, **settings):
+        youtube = dict(facade=True, poster_url=self.api.url + '/posters/{id}.jpg')
+        youtube.update(settings.get('YOUTUBE', {}))
+        vimeo = dict(facade=True)
+        vimeo.update(settings.get('VIMEO', {}))
+        settings.update(YOUTUBE=youtube, VIMEO=vimeo)
+        super(FacadeTestCase, self).init(**settings)
+
+    def output(self, *names):
+        """The path of the posters in the output"""
+        return os.path.join(self.path, 'output', 'theme', 'embeds', *names)
+
+
+class FacadeTest(FacadeTestCase):
+
+    def test_markup(self):
+        self.init()
+        self.assertEqual(
+            embeds.YOUTUBE.render('tree123'),
+            '<div class="youtube" align="left"><div class="embed-facade" '
+            'data-src="https://www.youtube.com/embed/tree123" data-width="420" data-height="236" '
+            'data-trigger="click" data-autoplay="1" style="width:420px;height:236px;'
+            'background-image:url(\'https://example.com/theme/embeds/youtube-tree123.jpg\')">'
+            '<a class="embed-facade-play" href="https://www.youtube.com/watch?v=tree123" '
+            'title="Counting trees &amp; their rings">Play</a></div></div>')
+        # Vimeo's posters come from the metadata
+        self.assertEqual(
+            embeds.VIMEO.render('76979871', align='center'),
+            '<div class="vimeo" align="center"><div class="embed-facade" '
+            'data-src="https://player.vimeo.com/video/76979871" data-width="420" data-height="315" '
+            'data-trigger="click" data-autoplay="1" style="width:420px;height:315px;'
+            'background-image:url(\'https://example.com/theme/embeds/vimeo-76979871.jpg\')">'
+            '<a class="embed-facade-play" href="https://vimeo.com/76979871" '
+            'title="Belfast from above">Play</a></div></div>')
+        self.assertEqual(
+            embeds.JSFIDDLE.render('if1live/V2P28'),
+            '<div class="jsfiddle">'
+            '<iframe width="100%" height="300" '
+            'src="http://jsfiddle.net/if1live/V2P28/embedded/js,resources,html,css,result/light/" '
+            'allowfullscreen="allowfullscreen" frameborder="0"></iframe></div>')
+
+    def test_copy_posters(self):
+        self.init()
+        embeds.YOUTUBE.render('tree123')
+        embeds.VIMEO.render('76979871')
+        embeds.copy_posters(Pelican({}, os.path.join(self.path, 'output')))
+        self.assertEqual(sorted(os.listdir(self.output())), ['vimeo-76979871.jpg', 'youtube-tree123.jpg'])
+        with open(self.output('youtube-tree123.jpg'), 'rb') as fd:
+            self.assertEqual(fd.read(), b'youtube poster')
+        with open(self.output('vimeo-76979871.jpg'), 'rb') as fd:
+            self.assertEqual(fd.read(), b'vimeo poster')
+
+    def test_posters_are_fetched_once(self):
+        self.init()
+        embeds.YOUTUBE.render('tree123')
+        self.init()
+        embeds.YOUTUBE.render('tree123')
+        self.assertEqual(self.api.paths(), ['/youtube/oembed/tree123', '/posters/tree123.jpg'])
+
+    def test_posters_need_facades(self):
+        self.init(YOUTUBE={'facade': False}, VIMEO={'facade': False})
+        embeds.YOUTUBE.render('tree123')
+        embeds.copy_posters(Pelican({}, os.path.join(self.path, 'output')))
+        self.assertFalse(os.path.exists(self.output()))
+        self.assertNotIn('/posters/tree123.jpg', self.api.paths())
+
+
+class FailureTest(FacadeTestCase):
+
+    def setUp(self):
+        super(FailureTest, self).setUp()
+        self.api.respond('/youtube/oembed/tree123', b'', status=500)
+        self.api.respond('/posters/tree123.jpg', b'', status=503)
+
+    def test_failures_are_not_retried(self):
+        self.init()
+        for _ in range(3):
+            html = embeds.YOUTUBE.render('tree123')
+        # The remote poster, and no metadata
+        self.assertIn("url('%s/posters/tree123.jpg')" % self.api.url, html)
+        self.assertIn('data-height="315"', html)
+        self.assertEqual(self.api.paths(), ['/youtube/oembed/tree123', '/posters/tree123.jpg'])
+        # Nor by the next build
+        self.init()
+        embeds.YOUTUBE.render('tree123')
+        self.assertEqual(len(self.api.paths()), 2)
+        # Failures aren't posters
+        embeds.copy_posters(Pelican({}, os.path.join(self.path, 'output')))
+        self.assertFalse(os.path.exists(self.output()))
+
+    def test_failures_are_retried_after_the_ttl(self):
+        self.init(YOUTUBE={'oembed_ttl': 60})
+        embeds.YOUTUBE.render('tree123')
+        failed = os.path.join(self.path, 'youtube', 'failed')
+        for name in os.listdir(failed):
+            os.utime(os.path.join(failed, name), (time.time() - 120, time.time() - 120))
+        self.api.respond('/youtube/oembed/tree123', fixture('youtube_oembed.json'))
+        self.api.respond('/posters/tree123.jpg', b'youtube poster')
+
+        html = embeds.YOUTUBE.render('tree123')
+        self.assertIn("url('https://example.com/theme/embeds/youtube-tree123.jpg')", html)
+        self.assertIn('data-height="236"', html)
+        self.assertEqual(len(self.api.paths()), 4)
+
+    def test_stale_metadata_is_used(self):
+        self.api.respond('/youtube/oembed/tree123', fixture('youtube_oembed.json'))
+        self.init(YOUTUBE={'oembed_ttl': 60})
+        embeds.YOUTUBE.render('tree123')
+        stale = os.path.join(self.path, 'youtube', 'oembed', 'tree123.json')
+        os.utime(stale, (time.time() - 120, time.time() - 120))
+        self.api.respond('/youtube/oembed/tree123', b'', status=500)
+
+        for _ in range(2):
+            self.assertIn('data-height="236"', embeds.YOUTUBE.render('tree123'))
+        self.assertEqual(self.api.paths().count('/youtube/oembed/tree123'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
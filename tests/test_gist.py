@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from tests import fixture
+from tests.standin import StandIn
+
+from gist import gist as gist_plugin
+from gist.snapshot import GistSnapshots
+
+
+class GistSnapshotsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.api = StandIn()
+        self.path = tempfile.mkdtemp()
+        self.gist = fixture('gist.json').decode('utf-8').replace('{url}', self.api.url)
+        self.api.respond('/raw/abc123/big.txt', b'the whole file\n')
+
+    def tearDown(self):
+        self.api.close()
+        shutil.rmtree(self.path)
+
+    def snapshots(self, check=True):
+        return GistSnapshots(self.path, self.api.url + '/gists/', timeout=2, check=check)
+
+    def saved(self):
+        with open(os.path.join(self.path, 'abc123.json')) as fd:
+            return json.load(fd)
+
+    def serve_gist(self, body=None, etag='"etag-2"'):
+        self.api.respond('/gists/abc123', (body or self.gist).encode('utf-8'), headers={'ETag': etag})
+
+    def serve_not_modified(self, etag='"etag-2"'):
+        def answer(headers):
+            if headers.get('If-None-Match') == etag:
+                return 304, {'ETag': etag}, b''
+            return 200, {'ETag': etag}, self.gist.encode('utf-8')
+        self.api.respond('/gists/abc123', answer)
+
+    def test_fetch_writes_snapshot(self):
+        self.serve_gist()
+        html = self.snapshots().render('abc123')
+
+        snapshot = self.saved()
+        self.assertEqual(snapshot['revision'], 'rev2')
+        self.assertEqual(snapshot['etag'], '"etag-2"')
+        self.assertEqual(snapshot['url'], 'https://gist.github.com/abc123')
+        # Truncated files are fetched from their raw url
+        self.assertEqual(snapshot['files'], [
+            {'name': 'Big File.txt', 'language': 'Text', 'content': 'the whole file\n'},
+            {'name': 'hello.py', 'language': 'Python', 'content': "print('hello')\n"},
+        ])
+        self.assertTrue(html.startswith('<div class="gist" id="gist-abc123">'))
+        self.assertIn('<div class="highlight">', html)
+        self.assertIn('href="https://gist.github.com/abc123#file-big-file-txt"', html)
+        self.assertIn('href="https://gist.github.com/abc123#file-hello-py"', html)
+
+    def test_not_modified_reuses_snapshot(self):
+        self.serve_gist()
+        first = self.snapshots().render('abc123')
+        mtime = os.path.getmtime(os.path.join(self.path, 'abc123.json'))
+
+        self.serve_not_modified()
+        del self.api.requests[:]
+        second = self.snapshots().render('abc123')
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.api.paths(), ['/gists/abc123'])
+        self.assertEqual(self.api.requests[0][1].get('If-None-Match'), '"etag-2"')
+        self.assertEqual(os.path.getmtime(os.path.join(self.path, 'abc123.json')), mtime)
+
+    def test_new_revision_replaces_snapshot(self):
+        self.serve_gist(etag='"etag-1"')
+        self.snapshots().render('abc123')
+
+        data = json.loads(self.gist)
+        data['history'].insert(0, {'version': 'rev3'})
+        data['files']['hello.py']['content'] = "print('hello again')\n"
+        self.serve_gist(json.dumps(data), etag='"etag-3"')
+        html = self.snapshots().render('abc123')
+
+        self.assertEqual(self.saved()['revision'], 'rev3')
+        self.assertEqual(self.saved()['etag'], '"etag-3"')
+        self.assertIn('hello again', html)
+
+    def test_failure_keeps_snapshot(self):
+        self.serve_gist()
+        first = self.snapshots().render('abc123')
+        saved = self.saved()
+
+        for status in (500, 403):
+            self.api.respond('/gists/abc123', b'{"message": "nope"}', status=status)
+            self.assertEqual(self.snapshots().render('abc123'), first)
+            self.assertEqual(self.saved(), saved)
+
+        self.api.close()
+        self.assertEqual(self.snapshots().render('abc123'), first)
+
+    def test_failure_without_snapshot(self):
+        self.api.respond('/gists/abc123', b'not json')
+        self.assertIsNone(self.snapshots().render('abc123'))
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'abc123.json')))
+
+    def test_unchecked_snapshot_isnt_fetched(self):
+        self.serve_gist()
+        first = self.snapshots().render('abc123')
+        del self.api.requests[:]
+
+        self.assertEqual(self.snapshots(check=False).render('abc123'), first)
+        self.assertEqual(self.api.requests, [])
+
+    def test_each_gist_is_checked_once_per_build(self):
+        self.serve_gist()
+        snapshots = self.snapshots()
+        snapshots.render('abc123')
+        snapshots.render('abc123')
+        self.assertEqual(self.api.paths().count('/gists/abc123'), 1)
+
+
+class GistShortcodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.api = StandIn()
+        self.path = tempfile.mkdtemp()
+        self.api.respond('/gists/abc123', fixture('gist.json').replace(b'{url}', self.api.url.encode('utf-8')))
+        self.api.respond('/raw/abc123/big.txt', b'the whole file\n')
+
+    def tearDown(self):
+        gist_plugin.gist.snapshots = None
+        self.api.close()
+        shutil.rmtree(self.path)
+
+    def test_script_without_snapshots(self):
+        gist_plugin.gist.snapshots = None
+        self.assertEqual(gist_plugin.gist('someone:abc123'),
+                         '<script src="https://gist.github.com/someone/abc123.js"></script>')
+
+    def test_snapshot(self):
+        gist_plugin.gist.snapshots = GistSnapshots(self.path, self.api.url + '/gists/', timeout=2)
+        self.assertTrue(gist_plugin.gist('someone:abc123').startswith('<div class="gist" id="gist-abc123">'))
+
+    def test_script_when_gist_cant_be_fetched(self):
+        gist_plugin.gist.snapshots = GistSnapshots(self.path, self.api.url + '/gists/', timeout=2)
+        self.assertEqual(gist_plugin.gist('someone:missing'),
+                         '<script src="https://gist.github.com/someone/missing.js"></script>')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from pelican import Pelican
+from pelican.settings import read_settings
+
+from tests import PLUGINS
+
+ARTICLE = '''\
+Trees
+#####
+
+:date: 2018-02-12
+:category: notes
+
+The trees of Belfast.
+'''
+
+
+class Messages(logging.Handler):
+    """Keeps the messages logged by the plugins"""
+
+    def __init__(self):
+        logging.Handler.__init__(self, logging.INFO)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class DevelopmentBuildTest(unittest.TestCase):
+    """Builds a site of one article the way src/config.py builds it in
+    development, with the content cache and the incremental plugin"""
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.content = os.path.join(self.path, 'content')
+        os.makedirs(self.content)
+        self.source = os.path.join(self.content, 'trees.rst')
+        with open(self.source, 'w') as fd:
+            fd.write(ARTICLE)
+
+        self.messages = Messages()
+        self.logger = logging.getLogger()
+        self.level = self.logger.level
+        self.logger.addHandler(self.messages)
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.messages)
+        self.logger.setLevel(self.level)
+        shutil.rmtree(self.path)
+
+    def build(self):
+        """Builds the site, and returns what the rst_cache plugin reported"""
+        settings = read_settings(override={
+            'PATH': self.content,
+            'OUTPUT_PATH': os.path.join(self.path, 'output'),
+            'CACHE_PATH': os.path.join(self.path, 'cache'),
+            'PLUGIN_PATHS': [PLUGINS],
+            'PLUGINS': ['incremental', 'rst_cache'],
+            'CACHE_CONTENT': True,
+            'LOAD_CONTENT_CACHE': True,
+            'FEED_ALL_ATOM': None,
+            'CATEGORY_FEED_ATOM': None,
+        })
+        del self.messages.messages[:]
+        Pelican(settings).run()
+        return [message for message in self.messages.messages if message.startswith('rst_cache plugin:')]
+
+    def test_second_build_hits(self):
+        # Without a manifest, the incremental plugin turns the content cache
+        # off for the first build
+        self.assertEqual(self.build(), ['rst_cache plugin: 0 hits, 1 misses'])
+        # Pelican's content cache goes by mtime, so the source is read again
+        later = time.time() + 10
+        os.utime(self.source, (later, later))
+        self.assertEqual(self.build(), ['rst_cache plugin: 1 hits, 0 misses'])
+
+
+if __name__ == '__main__':
+    unittest.main()